@@ -1,37 +1,114 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
 
+from . import search, transfer
 from .models import Post, Group, Comment, Follow
 
 
-class PostAdmin(admin.ModelAdmin):
+def estimated_count(queryset):
+    """Число строк в таблице по статистике базы, без COUNT(*)."""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        elif connection.vendor == "sqlite":
+            # Поиск по rowid идёт по B-дереву; удалённые строки завышают оценку.
+            cursor.execute(f"SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}")
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор без точного COUNT(*) по всей таблице.
+
+    Без фильтров число строк оценивается по статистике базы, с фильтрами
+    считается не больше COUNT_LIMIT строк, дальше страниц не показываем.
+    """
+    COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate > self.COUNT_LIMIT:
+                return estimate
+        return queryset.order_by()[:self.COUNT_LIMIT].count()
+
+
+def export_csv(name):
+    """Действие, которое отдаёт выбранные строки CSV-файлом по мере чтения из базы."""
+    def action(modeladmin, request, queryset):
+        rows = transfer.export_rows(name, queryset=queryset)
+        response = StreamingHttpResponse(transfer.csv_lines(name, rows),
+                                         content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{name}.csv"'
+        return response
+    action.__name__ = f"export_{name}_csv"
+    action.short_description = "Выгрузить в CSV"
+    return action
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Список, который открывается и на таблицах в миллионы строк."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ("-pk",)
+    empty_value_display = "-пусто-"
+
+
+class PostAdmin(ScalableAdmin):
     list_display = ("pk", "text", "pub_date", "author", "group")
+    list_select_related = ("author", "group")
     search_fields = ("text",)
-    list_filter = ("pub_date",)
-    list_editable = ("group",)
-    empty_value_display = "-пусто-"
+    list_filter = ("group",)
+    raw_id_fields = ("author",)
+    autocomplete_fields = ("group",)
+    actions = [export_csv("post")]
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term and search.enabled():
+            return search.admin_filter(queryset, search_term, "posts_post_fts"), False
+        return super().get_search_results(request, queryset, search_term)
 
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "slug", "description")
-    search_fields = ("description",)
+    search_fields = ("title", "slug", "description")
     list_filter = ("title",)
     empty_value_display = "-пусто-"
+    actions = [export_csv("group")]
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdmin):
     list_display = ("pk", "text", "post", "created", "author")
+    list_select_related = ("post", "author")
     search_fields = ("text",)
-    list_filter = ("created",)
-    empty_value_display = "-пусто-"
+    raw_id_fields = ("post", "author")
+    actions = [export_csv("comment")]
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term and search.enabled():
+            return search.admin_filter(queryset, search_term, "posts_comment_fts"), False
+        return super().get_search_results(request, queryset, search_term)
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     list_display = ("pk", "user", "author")
-    empty_value_display = "-пусто-"
+    list_select_related = ("user", "author")
+    raw_id_fields = ("user", "author")
+    actions = [export_csv("follow")]
 
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
-
@@ -0,0 +1,204 @@
+"""JSON API только для чтения.
+
+Ответы строятся из .values(), без моделей и шаблонов, на тех же
+querysets, курсорах и кэше страниц, что и HTML-ленты. Списки отдаются
+страницами по ?cursor=, а ?fields=id,text оставляет только нужные поля.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_safe
+from django.views.decorators.vary import vary_on_cookie
+
+from posts import counters, timeline
+from posts.caching import cached_feed, feed_etag
+from posts.models import Comment, Follow, Group, Post
+from posts.paginator import CursorPaginator, PER_PAGE
+
+MAX_PER_PAGE = 100
+
+# Поле ответа -> поле в .values().
+POST_FIELDS = {
+    "id": "id",
+    "text": "text",
+    "pub_date": "pub_date",
+    "author": "author__username",
+    "group": "group__slug",
+    "image": "image",
+    "comments_count": "comments_count",
+}
+COMMENT_FIELDS = {
+    "id": "id",
+    "post": "post_id",
+    "author": "author__username",
+    "text": "text",
+    "created": "created",
+}
+GROUP_FIELDS = {
+    "id": "id",
+    "slug": "slug",
+    "title": "title",
+    "description": "description",
+}
+FOLLOW_FIELDS = {
+    "id": "id",
+    "user": "user__username",
+    "author": "author__username",
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def api_view(view):
+    """Только GET/HEAD, ошибки отдаются JSON, а не HTML-страницей."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Http404:
+            return JsonResponse({"detail": "Не найдено"}, status=404)
+        except BadRequest as error:
+            return JsonResponse({"detail": str(error)}, status=400)
+    return wrapper
+
+
+def requested_fields(request, fields):
+    if "fields" not in request.GET:
+        return list(fields)
+    names = [name for name in request.GET["fields"].split(",") if name]
+    unknown = set(names) - fields.keys()
+    if unknown:
+        raise BadRequest(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+    return names
+
+
+def serialize(rows, names, fields):
+    """Переименовывает ключи .values() в поля ответа."""
+    result = []
+    for row in rows:
+        item = {name: row[fields[name]] for name in names}
+        if "image" in item:
+            item["image"] = f"{settings.MEDIA_URL}{item['image']}" if item["image"] else None
+        result.append(item)
+    return result
+
+
+def page_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query["cursor"] = cursor
+    return f"{request.path}?{query.urlencode()}"
+
+
+def per_page(request):
+    try:
+        return max(1, min(int(request.GET.get("limit", PER_PAGE)), MAX_PER_PAGE))
+    except ValueError:
+        raise BadRequest("limit должен быть числом")
+
+
+def page_response(request, queryset, fields, ordering, paginator_class=CursorPaginator):
+    names = requested_fields(request, fields)
+    # Поля сортировки нужны курсору, даже если их не просили.
+    lookups = set(fields[name] for name in names) | {name.lstrip("-") for name in ordering}
+    paginator = paginator_class(queryset.values(*lookups), per_page(request), ordering)
+    page = paginator.get_page(request.GET.get("cursor"))
+    return JsonResponse({
+        "results": serialize(page, names, fields),
+        "next": page_url(request, page.next_cursor),
+        "previous": page_url(request, page.previous_cursor),
+    })
+
+
+def object_response(request, queryset, fields):
+    names = requested_fields(request, fields)
+    row = queryset.values(*(fields[name] for name in names)).first()
+    if row is None:
+        raise Http404
+    return JsonResponse(serialize([row], names, fields)[0])
+
+
+POST_ORDERING = ("-pub_date", "-id")
+
+
+def feed_view(feeds):
+    """Ленты кэшируются и проверяются по ETag так же, как HTML-страницы."""
+    def decorator(view):
+        return api_view(vary_on_cookie(
+            condition(etag_func=feed_etag(feeds))(cached_feed(feeds)(view))
+        ))
+    return decorator
+
+
+@feed_view(lambda: ["index"])
+def posts(request):
+    return page_response(request, Post.objects.all(), POST_FIELDS, POST_ORDERING)
+
+
+@api_view
+def post_detail(request, post_id):
+    return object_response(request, Post.objects.filter(pk=post_id), POST_FIELDS)
+
+
+@api_view
+def post_comments(request, post_id):
+    get_object_or_404(Post.objects.only("pk"), pk=post_id)
+    return page_response(request, Comment.objects.filter(post_id=post_id),
+                         COMMENT_FIELDS, ("created", "id"))
+
+
+@api_view
+def groups(request):
+    return page_response(request, Group.objects.all(), GROUP_FIELDS, ("id",))
+
+
+@feed_view(lambda slug: [f"group:{slug}"])
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.only("pk"), slug=slug)
+    return page_response(request, Post.objects.filter(group=group), POST_FIELDS, POST_ORDERING)
+
+
+@api_view
+def user_detail(request, username):
+    user = get_object_or_404(User, username=username)
+    stats = counters.stats_for(user)
+    return JsonResponse({
+        "username": user.username,
+        "full_name": user.get_full_name(),
+        "posts_count": stats.posts_count,
+        "followers_count": stats.followers_count,
+        "following_count": stats.following_count,
+    })
+
+
+@feed_view(lambda username: [f"profile:{username}"])
+def user_posts(request, username):
+    user = get_object_or_404(User.objects.only("pk"), username=username)
+    return page_response(request, Post.objects.filter(author=user), POST_FIELDS, POST_ORDERING)
+
+
+@api_view
+def user_following(request, username):
+    user = get_object_or_404(User.objects.only("pk"), username=username)
+    return page_response(request, Follow.objects.filter(user=user), FOLLOW_FIELDS, ("-id",))
+
+
+@api_view
+def user_followers(request, username):
+    user = get_object_or_404(User.objects.only("pk"), username=username)
+    return page_response(request, Follow.objects.filter(author=user), FOLLOW_FIELDS, ("-id",))
+
+
+@api_view
+def follow_feed(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"detail": "Нужно войти"}, status=401)
+    return page_response(request, Post.objects.all(), POST_FIELDS, POST_ORDERING,
+                         timeline.paginator(request.user))
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     name = "posts"
     verbose_name = "Посты"
+
+    def ready(self):
+        from posts import signals  # noqa
+        from yatube import db
+        db.install()
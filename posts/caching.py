@@ -0,0 +1,168 @@
+"""Кэш страниц лент с поколениями.
+
+У каждой ленты (главная, сообщество, профиль автора) есть счётчик
+поколения. Ключ закэшированной страницы включает текущее поколение, поэтому
+запись поста, комментария или сообщества просто увеличивает счётчик, и
+старые страницы перестают находиться сразу, а не через TTL.
+
+Чтение поколений ничего не пишет в кэш: счётчик заводится, только когда
+вьюха ответила 200, то есть лента существует, и удаляется вместе с
+сообществом или автором. Пока счётчика нет, страница не кэшируется и
+ETag не выдаётся, так что для несуществующих лент ETag всегда None.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse
+from django.utils.http import quote_etag
+
+FEED_CACHE_TIMEOUT = getattr(settings, "FEED_CACHE_TIMEOUT", 60 * 60 * 24)
+HITS_KEY = "feed-cache:hits"
+MISSES_KEY = "feed-cache:misses"
+
+
+def generation_key(name):
+    return f"feed-gen:{name}"
+
+
+def generation(name):
+    """Текущее поколение ленты или None, если счётчик ещё не заведён."""
+    return cache.get(generation_key(name))
+
+
+def start(*names):
+    # Начинаем с текущего времени, чтобы после вытеснения счётчика
+    # не совпасть с поколением, под которым лежат старые страницы.
+    for name in names:
+        cache.add(generation_key(name), int(time.time() * 1000), None)
+
+
+def bump(*names):
+    # Без счётчика у ленты нет ни страниц в кэше, ни ETag: сбрасывать нечего.
+    for name in names:
+        try:
+            cache.incr(generation_key(name))
+        except ValueError:
+            pass
+
+
+def forget(*names):
+    """Удаляет поколения лент удалённого или переименованного объекта."""
+    cache.delete_many([generation_key(name) for name in names])
+
+
+def related(post, name):
+    # При каскадном удалении автора или сообщества их строки уже может не
+    # быть; поколения их лент удаляет forget().
+    try:
+        return getattr(post, name)
+    except ObjectDoesNotExist:
+        return None
+
+
+def feeds_for_post(post):
+    names = ["index", "trending"]
+    author = related(post, "author")
+    if author is not None:
+        names.append(f"profile:{author.username}")
+    group = related(post, "group")
+    if group is not None:
+        names.append(f"group:{group.slug}")
+        names.append(f"trending:{group.slug}")
+    return names
+
+
+def count(key):
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def stats():
+    return {
+        "hits": cache.get(HITS_KEY, 0),
+        "misses": cache.get(MISSES_KEY, 0),
+    }
+
+
+def page_key(request, names):
+    """Ключ страницы или None, если у какой-то из лент нет поколения."""
+    values = [generation(name) for name in names]
+    if None in values:
+        return None
+    generations = ":".join(f"{name}={value}" for name, value in zip(names, values))
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    return f"feed-page:{generations}:{user_id}:{path}"
+
+
+def feed_etag(feeds):
+    """etag_func для condition(): поколения ленты и текущий пользователь.
+
+    Пользователь входит в ETag, потому что страница для него своя
+    (шапка, кнопки автора), а ответ отдаётся с Vary: Cookie.
+    """
+    def etag(request, *args, **kwargs):
+        return etag_for(request, feeds(**kwargs))
+    return etag
+
+
+def etag_for(request, names):
+    values = [generation(name) for name in names]
+    if None in values:
+        return None
+    generations = ".".join(str(value) for value in values)
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    return f"{generations}-{user_id}"
+
+
+def cache_when_complete(chunks, key, content_type):
+    """Пропускает поток дальше и кэширует страницу, если он дошёл до конца."""
+    content = []
+    for chunk in chunks:
+        content.append(chunk)
+        yield chunk
+    cache.set(key, (b"".join(content), content_type), FEED_CACHE_TIMEOUT)
+
+
+def cached_feed(feeds):
+    """Кэширует страницу ленты; feeds(**kwargs) возвращает имена её поколений."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            names = feeds(**kwargs)
+            key = page_key(request, names)
+            cached = cache.get(key) if key is not None else None
+            if cached is not None:
+                count(HITS_KEY)
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+            count(MISSES_KEY)
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if key is None:
+                # Лента существует: заводим поколения и сразу отдаём ETag,
+                # который condition() до вызова вьюхи посчитать не смог.
+                start(*names)
+                key = page_key(request, names)
+                if key is None:
+                    return response
+                response["ETag"] = quote_etag(etag_for(request, names))
+            if response.streaming:
+                response.streaming_content = cache_when_complete(
+                    response.streaming_content, key, response["Content-Type"])
+            else:
+                cache.set(key, (response.content, response["Content-Type"]),
+                          FEED_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,46 @@
+"""Параллельная сборка страниц ленты.
+
+Независимые части страницы (страница постов, счётчики профиля,
+подписка) при FEED_CONCURRENCY считаются одновременно в общем пуле из
+FEED_THREADS потоков. У каждого потока своё соединение с базой, поэтому
+выигрыш есть там, где база отвечает параллельно (PostgreSQL), а запросы
+из пула не попадают в метрики и querycheck текущего запроса. По
+умолчанию выключено: тестам и SQLite это ничего не даёт.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, "FEED_CONCURRENCY", False)
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, "FEED_THREADS", 4),
+                                           thread_name_prefix="feed")
+        return _executor
+
+
+def _run(call):
+    try:
+        return call()
+    finally:
+        # Как в конце запроса: соединение живёт не дольше CONN_MAX_AGE.
+        close_old_connections()
+
+
+def gather(*calls):
+    """Результаты calls по порядку; первый считается в текущем потоке."""
+    if not enabled() or len(calls) < 2:
+        return [call() for call in calls]
+    futures = [executor().submit(_run, call) for call in calls[1:]]
+    return [calls[0]()] + [future.result() for future in futures]
@@ -0,0 +1,81 @@
+"""Денормализованные счётчики профиля и комментариев.
+
+Счётчики обновляются из сигналов атомарными UPDATE ... SET x = x + 1,
+поэтому страницы профиля не считают строки в больших таблицах.
+Команда rebuild_counters пересчитывает всё с нуля.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from posts.models import Comment, Follow, Post, UserStats
+
+BATCH_SIZE = 1000
+
+
+def count_for(user_id):
+    return {
+        "followers_count": Follow.objects.filter(author_id=user_id).count(),
+        "following_count": Follow.objects.filter(user_id=user_id).count(),
+        "posts_count": Post.objects.filter(author_id=user_id).count(),
+    }
+
+
+def rebuild_user(user_id):
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id, defaults=count_for(user_id)
+    )
+    return stats
+
+
+def stats_for(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return rebuild_user(user.pk)
+
+
+def change_user(user_id, field, delta):
+    updated = (UserStats.objects.filter(user_id=user_id)
+               .update(**{field: F(field) + delta}))
+    # При удалении пользователя его запись уже может быть стёрта каскадом,
+    # поэтому заново создаём её только при росте счётчика.
+    if not updated and delta > 0:
+        rebuild_user(user_id)
+
+
+def change_comments(post_id, delta):
+    # Версия меняется вместе со счётчиком, чтобы сбросить кэш карточки поста.
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F("comments_count") + delta,
+        version=F("version") + 1
+    )
+
+
+@transaction.atomic
+def rebuild_all():
+    comments = (Comment.objects.filter(post=OuterRef("pk")).order_by()
+                .values("post").annotate(total=Count("pk")).values("total"))
+    Post.objects.update(comments_count=Coalesce(Subquery(comments), Value(0)))
+
+    totals = {}
+    sources = [
+        ("followers_count", Follow.objects.values("author_id"), "author_id"),
+        ("following_count", Follow.objects.values("user_id"), "user_id"),
+        ("posts_count", Post.objects.values("author_id"), "author_id"),
+    ]
+    for field, queryset, key in sources:
+        rows = (queryset.exclude(**{key: None}).order_by()
+                .annotate(total=Count("pk")).values_list(key, "total"))
+        for user_id, total in rows.iterator():
+            totals.setdefault(user_id, {})[field] = total
+
+    UserStats.objects.all().delete()
+    batch = []
+    for user_id, values in totals.items():
+        batch.append(UserStats(user_id=user_id, **values))
+        if len(batch) >= BATCH_SIZE:
+            UserStats.objects.bulk_create(batch)
+            batch = []
+    UserStats.objects.bulk_create(batch)
+    return len(totals)
@@ -0,0 +1,46 @@
+"""Проверка подписки за один индексный запрос или без запросов вовсе.
+
+Множество авторов, на которых подписан пользователь, кэшируется целиком,
+если оно не слишком большое; при подписке и отписке кэш сбрасывается.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from posts.models import Follow
+
+FOLLOW_SET_CACHE = getattr(settings, "FOLLOW_SET_CACHE", True)
+FOLLOW_SET_LIMIT = getattr(settings, "FOLLOW_SET_LIMIT", 5000)
+FOLLOW_SET_TIMEOUT = 60 * 60
+
+
+def cache_key(user_id):
+    return f"follow-set:{user_id}"
+
+
+def following_ids(user_id):
+    """Id авторов, на которых подписан пользователь, или None, если их слишком много."""
+    key = cache_key(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(Follow.objects.filter(user_id=user_id)
+                   .values_list("author_id", flat=True)[:FOLLOW_SET_LIMIT + 1])
+        # False в кэше означает «подписок слишком много, спрашивайте базу».
+        ids = frozenset(ids) if len(ids) <= FOLLOW_SET_LIMIT else False
+        cache.set(key, ids, FOLLOW_SET_TIMEOUT)
+    if ids is False:
+        return None
+    return ids
+
+
+def is_following(user, author):
+    if not user.is_authenticated or user.pk == author.pk:
+        return False
+    if FOLLOW_SET_CACHE:
+        ids = following_ids(user.pk)
+        if ids is not None:
+            return author.pk in ids
+    return Follow.objects.filter(user=user, author=author).exists()
+
+
+def invalidate(user_id):
+    cache.delete(cache_key(user_id))
@@ -1,11 +1,13 @@
 from django import forms
 from .models import Post, Comment
+from .uploads import BoundedImageField
 
 
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ["text", "group", "image"]
+        field_classes = {"image": BoundedImageField}
         widgets = {
             "text": forms.Textarea(attrs={"class": "form-control", "rows": 5}),
             "group": forms.Select(attrs={"class": "form-control"})
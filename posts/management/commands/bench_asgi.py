@@ -0,0 +1,106 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.management.commands.bench_views import percentile
+from posts.models import UserStats
+from yatube import asgi
+
+
+def make_scope(path, host):
+    # Адрес не из INTERNAL_IPS, чтобы не мерить debug_toolbar.
+    return {
+        "type": "http", "method": "GET", "path": path, "query_string": b"",
+        "headers": [(b"host", host.encode())], "http_version": "1.1",
+        "client": ("192.0.2.1", 50000), "server": (host, 80),
+    }
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает пропускную способность и задержки WSGI и ASGI входа при одинаковой "
+            "параллельной нагрузке; приложения вызываются напрямую, без сети")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--host", default="localhost")
+        parser.add_argument("--path", action="append", dest="paths",
+                            help="Страница для нагрузки; по умолчанию лента и самый популярный профиль")
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or self.default_paths()
+        self.stdout.write(f"{'path':<28} {'mode':<16} {'req/s':>8} {'p50 ms':>8} "
+                          f"{'p99 ms':>8} {'errors':>7}")
+        modes = [
+            ("wsgi", self.run_wsgi, False),
+            ("asgi", self.run_asgi, False),
+            ("asgi+gather", self.run_asgi, True),
+        ]
+        for path in paths:
+            for name, run, concurrent in modes:
+                scope = make_scope(path, options["host"])
+                with override_settings(FEED_CONCURRENCY=concurrent):
+                    run(scope, 1)  # прогрев кэша
+                    started = time.perf_counter()
+                    results = run(scope, options["requests"], options["concurrency"])
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(self.format_row(path, name, results, elapsed))
+
+    def default_paths(self):
+        author = (UserStats.objects.order_by("-followers_count")
+                  .select_related("user").first())
+        if author is None:
+            raise CommandError("В базе нет пользователей, сначала запустите generate_data")
+        return [reverse("index"), reverse("profile", args=[author.user.username])]
+
+    def wsgi_request(self, scope):
+        environ = asgi.build_environ(scope, BytesIO())
+        status = []
+        started = time.perf_counter()
+        result = asgi.wsgi_application(environ, lambda line, headers, exc_info=None:
+                                            status.append(int(line.split()[0])))
+        try:
+            b"".join(result)
+        finally:
+            result.close()
+        return time.perf_counter() - started, status[0]
+
+    def run_wsgi(self, scope, requests, concurrency=1):
+        # Так работает многопоточный WSGI-сервер: поток на запрос.
+        with ThreadPoolExecutor(concurrency) as pool:
+            return list(pool.map(lambda _: self.wsgi_request(scope), range(requests)))
+
+    async def asgi_request(self, scope):
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        started = time.perf_counter()
+        await asgi.application(scope, receive, send)
+        return time.perf_counter() - started, messages[0]["status"]
+
+    def run_asgi(self, scope, requests, concurrency=1):
+        async def load():
+            limit = asyncio.Semaphore(concurrency)
+
+            async def one():
+                async with limit:
+                    return await self.asgi_request(scope)
+            return await asyncio.gather(*(one() for _ in range(requests)))
+        return asyncio.run(load())
+
+    def format_row(self, path, name, results, elapsed):
+        latencies = [seconds * 1000 for seconds, _ in results]
+        errors = sum(status >= 400 for _, status in results)
+        return (f"{path[:28]:<28} {name:<16} {len(results) / elapsed:>8.0f} "
+                f"{percentile(latencies, 0.5):>8.1f} {percentile(latencies, 0.99):>8.1f} "
+                f"{errors:>7}")
@@ -0,0 +1,91 @@
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = [
+    ("locmem", "django.core.cache.backends.locmem.LocMemCache", None),
+    ("filebased", "django.core.cache.backends.filebased.FileBasedCache", "files"),
+    ("sqlite", "yatube.sqlite_cache.SQLiteCache", "cache.sqlite3"),
+]
+
+
+def make_cache(path, location):
+    params = {"OPTIONS": {"MAX_ENTRIES": 1000000}}
+    return import_string(path)(location, params)
+
+
+def write_keys(args):
+    path, location, worker, operations = args
+    cache = make_cache(path, location)
+    for number in range(operations):
+        cache.set(f"w{worker}-{number}", number)
+
+
+def read_keys(args):
+    path, location, worker, operations = args
+    cache = make_cache(path, location)
+    started = time.perf_counter()
+    hits = sum(cache.get(f"w{worker}-{number}") is not None
+               for number in range(operations))
+    return hits, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Сравнивает бэкенды кэша: скорость операций и общий доступ из нескольких процессов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operations", type=int, default=5000)
+        parser.add_argument("--processes", type=int, default=4)
+
+    def handle(self, *args, **options):
+        operations = options["operations"]
+        processes = options["processes"]
+        directory = tempfile.mkdtemp()
+        try:
+            self.stdout.write(f"{'backend':<10} {'set/s':>10} {'get/s':>10} "
+                              f"{'incr/s':>10} {'shared hits':>12}")
+            for name, path, location in BACKENDS:
+                location = f"{directory}/{location}" if location else f"bench-{name}"
+                self.stdout.write(self.bench(name, path, location, operations, processes))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def bench(self, name, path, location, operations, processes):
+        cache = make_cache(path, location)
+        cache.clear()
+
+        started = time.perf_counter()
+        for number in range(operations):
+            cache.set(f"key-{number}", number)
+        set_rate = operations / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for number in range(operations):
+            cache.get(f"key-{number}")
+        get_rate = operations / (time.perf_counter() - started)
+
+        cache.set("counter", 0)
+        started = time.perf_counter()
+        for _ in range(operations):
+            cache.incr("counter")
+        incr_rate = operations / (time.perf_counter() - started)
+
+        # Каждый процесс пишет свои ключи, затем другой процесс их читает:
+        # у кэша в памяти процесса попаданий не будет.
+        per_worker = max(operations // processes, 1)
+        jobs = [(path, location, worker, per_worker) for worker in range(processes)]
+        with multiprocessing.Pool(processes) as pool:
+            pool.map(write_keys, jobs)
+        shifted = [(path, location, (worker + 1) % processes, per_worker)
+                   for worker in range(processes)]
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(read_keys, shifted)
+        hits = sum(hit for hit, _ in results)
+        shared = hits / (per_worker * processes)
+
+        return (f"{name:<10} {set_rate:>10.0f} {get_rate:>10.0f} "
+                f"{incr_rate:>10.0f} {shared:>11.0%}")
@@ -0,0 +1,108 @@
+import multiprocessing
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+# Те же прагмы, что в settings_production, если в текущих настройках их нет.
+TUNED_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+READ_SQL = ("SELECT p.id, p.text, p.pub_date, u.username FROM posts_post p "
+            "JOIN auth_user u ON u.id = p.author_id "
+            "ORDER BY p.pub_date DESC, p.id DESC LIMIT 10 OFFSET ?")
+WRITE_SQL = "UPDATE posts_post SET version = version + 1 WHERE id = ?"
+
+
+def connect(path, pragmas):
+    db = sqlite3.connect(path, timeout=5, isolation_level=None)
+    for name, value in pragmas.items():
+        db.execute(f"PRAGMA {name} = {value}")
+    return db
+
+
+def run_worker(args):
+    """Крутит чтения или записи seconds секунд: (операций, ошибок блокировки)."""
+    path, pragmas, persistent, role, seconds, max_id = args
+    rng = random.Random()
+    db = connect(path, pragmas) if persistent else None
+    done = locked = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        # Без постоянного соединения каждый «запрос» открывает своё, как при CONN_MAX_AGE=0.
+        current = db or connect(path, pragmas)
+        try:
+            if role == "read":
+                current.execute(READ_SQL, (rng.randrange(100),)).fetchall()
+            else:
+                current.execute(WRITE_SQL, (rng.randint(1, max_id),))
+            done += 1
+        except sqlite3.OperationalError:
+            locked += 1
+        finally:
+            if db is None:
+                current.close()
+    if db is not None:
+        db.close()
+    return role, done, locked
+
+
+class Command(BaseCommand):
+    help = ("Меряет пропускную способность SQLite при одновременных чтениях и записях "
+            "на копии текущей базы: настройки по умолчанию против WAL и постоянных соединений")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--seconds", type=float, default=5)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Бенчмарк только для SQLite")
+        tuned = getattr(settings, "SQLITE_PRAGMAS", None) or TUNED_PRAGMAS
+        configurations = [
+            # Копия может унаследовать WAL от исходного файла, поэтому режим явно.
+            ("default", {"journal_mode": "DELETE"}, False),
+            ("wal", tuned, False),
+            ("wal+persistent", tuned, True),
+        ]
+        directory = tempfile.mkdtemp()
+        try:
+            self.stdout.write(f"{'config':<16} {'reads/s':>10} {'writes/s':>10} {'locked':>8}")
+            for name, pragmas, persistent in configurations:
+                path = f"{directory}/{name}.sqlite3"
+                max_id = self.copy_database(path)
+                self.stdout.write(self.bench(name, path, pragmas, persistent, max_id, options))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def copy_database(self, path):
+        """Копия текущей базы, чтобы записи бенчмарка не трогали настоящие данные."""
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        try:
+            connection.connection.backup(target)
+            return target.execute("SELECT COALESCE(MAX(id), 1) FROM posts_post").fetchone()[0]
+        finally:
+            target.close()
+
+    def bench(self, name, path, pragmas, persistent, max_id, options):
+        seconds = options["seconds"]
+        jobs = ([(path, pragmas, persistent, "read", seconds, max_id)] * options["readers"]
+                + [(path, pragmas, persistent, "write", seconds, max_id)] * options["writers"])
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.map(run_worker, jobs)
+        reads = sum(done for role, done, _ in results if role == "read")
+        writes = sum(done for role, done, _ in results if role == "write")
+        locked = sum(errors for _, _, errors in results)
+        return (f"{name:<16} {reads / seconds:>10.0f} {writes / seconds:>10.0f} "
+                f"{locked:>8}")
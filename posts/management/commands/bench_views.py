@@ -0,0 +1,136 @@
+import json
+import platform
+import time
+import tracemalloc
+from statistics import mean
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Group, Post, UserStats
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = ("Гоняет ленты через тестовый клиент и меряет задержку, число запросов "
+            "к базе и память по каждой странице; результат пишется в JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument("--cold", action="store_true",
+                            help="Очищать кэш перед каждым запросом")
+        parser.add_argument("--output", help="Куда сохранить результаты в JSON")
+        parser.add_argument("--compare", help="JSON прошлого запуска для сравнения")
+
+    def handle(self, *args, **options):
+        targets = self.targets()
+        if not targets:
+            raise CommandError("В базе нет постов, сначала запустите generate_data")
+        results = {}
+        self.stdout.write(f"{'view':<14} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+                          f"{'queries':>8} {'peak KB':>8}")
+        for name, (url, user) in targets.items():
+            results[name] = self.bench(url, user, options["requests"], options["cold"])
+            self.stdout.write(self.format_row(name, results[name]))
+
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "posts": Post.objects.count(),
+            "requests": options["requests"],
+            "cold": options["cold"],
+            "views": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as stream:
+                json.dump(report, stream, indent=2)
+        if options["compare"]:
+            self.compare(options["compare"], results)
+
+    def targets(self):
+        post = Post.objects.order_by("-comments_count").select_related("author").first()
+        if post is None:
+            return {}
+        author = (UserStats.objects.order_by("-followers_count")
+                  .select_related("user").first())
+        reader = (UserStats.objects.order_by("-following_count")
+                  .select_related("user").first())
+        group = (Group.objects.annotate(total=Count("posts"))
+                 .order_by("-total").first())
+        targets = {
+            "index": (reverse("index"), None),
+            "index_deep": (reverse("index") + "?page=50", None),
+            "post_view": (reverse("post", args=[post.author.username, post.pk]), None),
+        }
+        if author is not None:
+            targets["profile"] = (reverse("profile", args=[author.user.username]), None)
+        if reader is not None:
+            targets["follow_index"] = (reverse("follow_index"), reader.user)
+        if group is not None:
+            targets["group"] = (reverse("group", args=[group.slug]), None)
+        return targets
+
+    def bench(self, url, user, requests, cold):
+        # Адрес не из INTERNAL_IPS, чтобы не мерить debug_toolbar.
+        client = Client(REMOTE_ADDR="192.0.2.1")
+        if user is not None:
+            client.force_login(user)
+        latencies = []
+        queries = []
+        for _ in range(requests):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(url)
+                latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"{url}: ответ {response.status_code}")
+            queries.append(len(context.captured_queries))
+
+        # Память меряем отдельным запросом: tracemalloc сильно замедляет код.
+        if cold:
+            cache.clear()
+        tracemalloc.start()
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            "url": url,
+            "p50_ms": round(percentile(latencies, 0.5), 2),
+            "p90_ms": round(percentile(latencies, 0.9), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "mean_ms": round(mean(latencies), 2),
+            "queries": round(mean(queries), 1),
+            "max_queries": max(queries),
+            "peak_kb": peak // 1024,
+        }
+
+    def format_row(self, name, result):
+        return (f"{name:<14} {result['p50_ms']:>8.1f} {result['p90_ms']:>8.1f} "
+                f"{result['p99_ms']:>8.1f} {result['queries']:>8.1f} {result['peak_kb']:>8}")
+
+    def compare(self, path, results):
+        with open(path) as stream:
+            previous = json.load(stream)["views"]
+        self.stdout.write(f"\nСравнение с {path}:")
+        for name, result in results.items():
+            if name not in previous:
+                continue
+            before = previous[name]
+            change = (result["p50_ms"] - before["p50_ms"]) / max(before["p50_ms"], 1e-6)
+            self.stdout.write(
+                f"{name:<14} p50 {before['p50_ms']:.1f} -> {result['p50_ms']:.1f} ms "
+                f"({change:+.0%}), запросов {before['queries']} -> {result['queries']}"
+            )
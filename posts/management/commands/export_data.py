@@ -0,0 +1,32 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = "Выгружает группы, посты, комментарии или подписки в JSONL или CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(transfer.SPECS))
+        parser.add_argument("path", help="Файл или - для stdout")
+        parser.add_argument("--format", choices=["jsonl", "csv"])
+        parser.add_argument("--chunk-size", type=int, default=transfer.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or transfer.format_for(path)
+        rows = transfer.export_rows(options["model"], options["chunk_size"])
+        started = time.monotonic()
+        if path == "-":
+            written = transfer.write_rows(options["model"], rows, sys.stdout, file_format)
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as stream:
+                written = transfer.write_rows(options["model"], rows, stream, file_format)
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(
+            f"Выгружено строк: {written} за {elapsed:.1f} с "
+            f"({written / max(elapsed, 1e-6):.0f} строк/с)"
+        ))
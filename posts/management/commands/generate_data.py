@@ -0,0 +1,134 @@
+import random
+import time
+from bisect import bisect
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from posts import transfer
+from posts.models import Group, Post
+
+WORDS = ("кот собака погода город море лето зима книга фильм музыка работа "
+         "дом дорога утро вечер друг новости спорт футбол программирование "
+         "django python поезд самолёт кофе чай горы лес река праздник").split()
+
+
+class PowerLaw:
+    """Номера 0..size-1, где номер k выпадает с весом 1 / (k + 1) ** exponent."""
+
+    def __init__(self, size, exponent, rng):
+        self.rng = rng
+        self.cumulative = list(accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
+    def pick(self):
+        return bisect(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+class Command(BaseCommand):
+    help = ("Заполняет базу синтетическими данными: популярность авторов, "
+            "подписок и комментариев распределена по степенному закону")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--posts", type=int, default=100000)
+        parser.add_argument("--comments", type=int, default=200000)
+        parser.add_argument("--follows", type=int, default=100000)
+        parser.add_argument("--groups", type=int, default=50)
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--exponent", type=float, default=1.1)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="gen")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options["seed"])
+        self.prefix = options["prefix"]
+        self.now = timezone.now()
+
+        self.step("users", self.create_users)
+        self.step("groups", self.create_groups)
+        users = PowerLaw(options["users"], options["exponent"], self.rng)
+        self.step("posts", lambda: transfer.import_rows("post", self.posts(users)))
+        self.step("comments", lambda: transfer.import_rows("comment", self.comments()))
+        self.step("follows", lambda: transfer.import_rows("follow", self.follows(users)))
+        self.step("rebuild", transfer.rebuild)
+
+    def step(self, name, action):
+        started = time.monotonic()
+        result = action()
+        elapsed = time.monotonic() - started
+        rows = f"{result} строк, " if isinstance(result, int) else ""
+        self.stdout.write(f"{name}: {rows}{elapsed:.1f} с")
+
+    def username(self, number):
+        return f"{self.prefix}{number}"
+
+    def date(self):
+        return (self.now - timedelta(days=self.options["days"] * self.rng.random())).isoformat()
+
+    def text(self, words):
+        return " ".join(self.rng.choice(WORDS) for _ in range(words))
+
+    def create_users(self):
+        batch = []
+        for number in range(self.options["users"]):
+            batch.append(User(username=self.username(number), password=make_password(None)))
+            if len(batch) >= transfer.BATCH_SIZE:
+                User.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        User.objects.bulk_create(batch, ignore_conflicts=True)
+        return self.options["users"]
+
+    def create_groups(self):
+        Group.objects.bulk_create(
+            [Group(title=f"Сообщество {number}", slug=f"{self.prefix}-{number}",
+                   description=self.text(10))
+             for number in range(self.options["groups"])],
+            ignore_conflicts=True
+        )
+        self.group_ids = list(Group.objects.filter(slug__startswith=f"{self.prefix}-")
+                              .order_by("pk").values_list("pk", flat=True))
+        return len(self.group_ids)
+
+    def posts(self, users):
+        groups = None
+        if self.group_ids:
+            groups = PowerLaw(len(self.group_ids), self.options["exponent"], self.rng)
+        self.first_post = (Post.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+        for _ in range(self.options["posts"]):
+            group_id = None
+            if groups and self.rng.random() < 0.5:
+                group_id = self.group_ids[groups.pick()]
+            yield {
+                "text": self.text(self.rng.randint(5, 60)),
+                "pub_date": self.date(),
+                "author": self.username(users.pick()),
+                "group_id": group_id,
+            }
+
+    def comments(self):
+        # id только что созданных постов идут подряд; чаще комментируют новые.
+        last_post = Post.objects.aggregate(last=Max("pk"))["last"] or 0
+        count = last_post - self.first_post + 1
+        if count <= 0:
+            return
+        posts = PowerLaw(count, self.options["exponent"], self.rng)
+        for _ in range(self.options["comments"]):
+            yield {
+                "post_id": last_post - posts.pick(),
+                "author": self.username(self.rng.randrange(self.options["users"])),
+                "text": self.text(self.rng.randint(2, 20)),
+                "created": self.date(),
+            }
+
+    def follows(self, users):
+        for _ in range(self.options["follows"]):
+            user = self.rng.randrange(self.options["users"])
+            author = users.pick()
+            if user != author:
+                yield {"user": self.username(user), "author": self.username(author)}
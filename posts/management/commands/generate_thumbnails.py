@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Заранее строит миниатюры всех размеров для уже загруженных картинок"
+
+    def handle(self, *args, **options):
+        images = (Post.objects.exclude(image="").exclude(image=None)
+                  .values_list("image", flat=True).distinct())
+        started = time.monotonic()
+        done = failed = 0
+        for name in images.iterator():
+            try:
+                thumbnails.generate(name)
+                done += 1
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f"{name}: {error}")
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: {done}, с ошибками: {failed}, за {elapsed:.1f} с"
+        ))
@@ -0,0 +1,61 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ("Загружает группы, посты, комментарии или подписки из JSONL или CSV. "
+            "Загружайте в порядке group, post, comment, follow")
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(transfer.SPECS))
+        parser.add_argument("path", help="Файл или - для stdin")
+        parser.add_argument("--format", choices=["jsonl", "csv"])
+        parser.add_argument("--batch-size", type=int, default=transfer.BATCH_SIZE)
+        parser.add_argument("--no-rebuild", action="store_true",
+                            help="Не пересчитывать счётчики, ленты и поиск, "
+                                 "например между загрузками нескольких файлов")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or transfer.format_for(path)
+        started = time.monotonic()
+
+        def progress(total):
+            if options["verbosity"] > 1:
+                elapsed = time.monotonic() - started
+                self.stderr.write(f"{total} строк, {total / max(elapsed, 1e-6):.0f} строк/с")
+
+        if path == "-":
+            loaded = self.load(options, sys.stdin, file_format, progress)
+        else:
+            with open(path, newline="", encoding="utf-8") as stream:
+                loaded = self.load(options, stream, file_format, progress)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Загружено строк: {loaded} за {elapsed:.1f} с "
+            f"({loaded / max(elapsed, 1e-6):.0f} строк/с)"
+        ))
+
+        if not options["no_rebuild"]:
+            started = time.monotonic()
+            transfer.rebuild()
+            self.stdout.write(f"Счётчики, ленты и поиск пересчитаны за "
+                              f"{time.monotonic() - started:.1f} с")
+
+    def load(self, options, stream, file_format, progress):
+        rows = transfer.read_rows(stream, file_format)
+        loaded = transfer.import_rows(options["model"], rows, options["batch_size"], progress)
+        # Строки пришли с явными id, последовательности PostgreSQL надо сдвинуть.
+        model = transfer.SPECS[options["model"]].model
+        statements = connection.ops.sequence_reset_sql(no_style(), [model])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+        return loaded
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики подписчиков, подписок, записей и комментариев"
+
+    def handle(self, *args, **options):
+        users = counters.rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f"Счётчики пересчитаны для {users} пользователей"))
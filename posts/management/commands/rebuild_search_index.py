@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = "Перестраивает полнотекстовый индекс постов и комментариев"
+
+    def handle(self, *args, **options):
+        if not search.enabled():
+            self.stdout.write("Полнотекстовый индекс есть только на SQLite, перестраивать нечего")
+            return
+        with transaction.atomic():
+            posts = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано постов: {posts}"))
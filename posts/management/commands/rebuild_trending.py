@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import caching, trending
+from posts.models import Group
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает популярность постов по комментариям; нужно после импорта "
+            "и после изменения TRENDING_HALF_LIFE или TRENDING_POST_WEIGHT")
+
+    def handle(self, *args, **options):
+        posts = trending.rebuild()
+        slugs = Group.objects.values_list("slug", flat=True)
+        caching.bump("trending", *(f"trending:{slug}" for slug in slugs))
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано постов: {posts}"))
@@ -0,0 +1,63 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:51
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Comment = apps.get_model("posts", "Comment")
+    Follow = apps.get_model("posts", "Follow")
+    Post = apps.get_model("posts", "Post")
+    UserStats = apps.get_model("posts", "UserStats")
+    comments = (Comment.objects.filter(post=OuterRef("pk")).order_by()
+                .values("post").annotate(total=Count("pk")).values("total"))
+    Post.objects.update(comments_count=Coalesce(Subquery(comments), Value(0)))
+    totals = {}
+    sources = [
+        ("followers_count", Follow.objects.values("author_id"), "author_id"),
+        ("following_count", Follow.objects.values("user_id"), "user_id"),
+        ("posts_count", Post.objects.values("author_id"), "author_id"),
+    ]
+    for field, queryset, key in sources:
+        rows = (queryset.exclude(**{key: None}).order_by()
+                .annotate(total=Count("pk")).values_list(key, "total"))
+        for user_id, total in rows:
+            totals.setdefault(user_id, {})[field] = total
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id, **values) for user_id, values in totals.items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0006_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('followers_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
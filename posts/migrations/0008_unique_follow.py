@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:52
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    Follow = apps.get_model("posts", "Follow")
+    UserStats = apps.get_model("posts", "UserStats")
+    duplicates = (Follow.objects.order_by().values("user_id", "author_id")
+                  .annotate(first=Min("pk"), total=Count("pk"))
+                  .filter(total__gt=1))
+    for row in duplicates:
+        extra = row["total"] - 1
+        Follow.objects.filter(user_id=row["user_id"], author_id=row["author_id"]) \
+            .exclude(pk=row["first"]).delete()
+        UserStats.objects.filter(user_id=row["author_id"]) \
+            .update(followers_count=F("followers_count") - extra)
+        UserStats.objects.filter(user_id=row["user_id"]) \
+            .update(following_count=F("following_count") - extra)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:14
+
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+        "text, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_comment_fts USING fts5("
+        "text, post_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_post_fts (rowid, text) SELECT id, text FROM posts_post"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_comment_fts (rowid, text, post_id) "
+        "SELECT id, text, post_id FROM posts_comment WHERE post_id IS NOT NULL"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS posts_post_fts")
+    schema_editor.execute("DROP TABLE IF EXISTS posts_comment_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:31
+
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def fill_scores(apps, schema_editor):
+    # То же, что trending.rebuild(), но на исторических моделях.
+    Comment = apps.get_model("posts", "Comment")
+    Post = apps.get_model("posts", "Post")
+    TrendingScore = apps.get_model("posts", "TrendingScore")
+    epoch = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    tau = getattr(settings, "TRENDING_HALF_LIFE", 12 * 60 * 60) / math.log(2)
+    post_weight = getattr(settings, "TRENDING_POST_WEIGHT", 3)
+
+    def event_score(moment, weight=1):
+        return math.log(weight) + (moment - epoch).total_seconds() / tau
+
+    def logaddexp(a, b):
+        high, low = max(a, b), min(a, b)
+        return high + math.log1p(math.exp(low - high))
+
+    last = 0
+    while True:
+        chunk = list(Post.objects.filter(pk__gt=last).order_by("pk")
+                     .values_list("pk", "group_id", "pub_date")[:1000])
+        if not chunk:
+            return
+        scores = {pk: event_score(pub_date, post_weight) for pk, _, pub_date in chunk}
+        comments = (Comment.objects.filter(post_id__in=scores).order_by()
+                    .values_list("post_id", "created"))
+        for post_id, created in comments:
+            scores[post_id] = logaddexp(scores[post_id], event_score(created))
+        TrendingScore.objects.bulk_create(
+            TrendingScore(post_id=pk, group_id=group_id, score=scores[pk])
+            for pk, group_id, _ in chunk
+        )
+        last = chunk[-1][0]
+
+
+def create_logaddexp(apps, schema_editor):
+    # На SQLite функция регистрируется из Python при открытии соединения.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE OR REPLACE FUNCTION logaddexp(a double precision, b double precision) "
+        "RETURNS double precision AS "
+        "'SELECT GREATEST(a, b) + ln(1 + exp(-abs(a - b)))' "
+        "LANGUAGE SQL IMMUTABLE"
+    )
+
+
+def drop_logaddexp(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP FUNCTION IF EXISTS logaddexp(double precision, double precision)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_comment_post_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('score', models.FloatField(verbose_name='Популярность')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Group', verbose_name='Сообщество')),
+            ],
+            options={
+                'verbose_name': 'Популярность поста',
+                'verbose_name_plural': 'Популярность постов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='trendingscore',
+            index=models.Index(fields=['-score'], name='trending_score'),
+        ),
+        migrations.AddIndex(
+            model_name='trendingscore',
+            index=models.Index(fields=['group', '-score'], name='trending_group_score'),
+        ),
+        migrations.RunPython(create_logaddexp, drop_logaddexp),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.utils.timezone
+
+
+def fill_pub_date(apps, schema_editor):
+    Post = apps.get_model("posts", "Post")
+    TimelineEntry = apps.get_model("posts", "TimelineEntry")
+    TimelineEntry.objects.update(pub_date=Subquery(
+        Post.objects.filter(pk=OuterRef("post_id")).values("pub_date")[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_trendingscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timelineentry',
+            name='pub_date',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата публикации'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_pub_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_date'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_date'),
+        ),
+    ]
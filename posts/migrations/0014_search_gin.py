@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# Выражение должно совпадать с тем, что строит posts.search для PostgreSQL,
+# иначе планировщик не возьмёт индекс.
+INDEXES = {
+    "posts_post_text_search": "posts_post",
+    "posts_comment_text_search": "posts_comment",
+}
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, table in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX {name} ON {table} USING GIN (to_tsvector('russian', text))"
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_timeline_pub_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
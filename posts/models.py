@@ -2,6 +2,12 @@ from django.db import models
 from django.contrib.auth.models import User
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для ленты вместе с автором и сообществом."""
+        return self.select_related("author", "group")
+
+
 class Post(models.Model):
     text = models.TextField(verbose_name="Текст поста",
                             help_text="Соблюдайте правила "
@@ -16,11 +22,21 @@ class Post(models.Model):
                               help_text="Выберите сообщество в выпадающем "
                                         "списке, или оставте это поле пустым")
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comments_count = models.PositiveIntegerField(default=0, editable=False,
+                                                 verbose_name="Комментариев")
+    version = models.PositiveIntegerField(default=0, editable=False,
+                                          verbose_name="Версия")
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
         ordering = ["-pub_date"]
+        indexes = [
+            # Лента автора и посты «звёзд», подмешиваемые в ленту подписок.
+            models.Index(fields=["author", "-pub_date", "-id"], name="post_author_date"),
+        ]
 
     def __str__(self):
         return self.text
@@ -51,6 +67,9 @@ class Comment(models.Model):
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
         ordering = ["created"]
+        indexes = [
+            models.Index(fields=["post", "created"], name="comment_post_created"),
+        ]
 
     def __str__(self):
         return self.text
@@ -64,7 +83,64 @@ class Follow(models.Model):
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
         ordering = ["author"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "author"], name="unique_follow"),
+        ]
 
     def __str__(self):
         return f"{self.user} подписан на {self.author}"
 
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline", verbose_name="Читатель")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries", verbose_name="Пост")
+    # Копия post.pub_date: страница ленты читается по индексу записей.
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "post"], name="unique_timeline_entry"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-pub_date", "-post"], name="timeline_user_date"),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} в ленте {self.user}"
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="stats", verbose_name="Пользователь")
+    followers_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name="Подписчиков")
+    following_count = models.PositiveIntegerField(default=0, verbose_name="Подписок")
+    posts_count = models.PositiveIntegerField(default=0, verbose_name="Записей")
+
+    class Meta:
+        verbose_name = "Статистика пользователя"
+        verbose_name_plural = "Статистика пользователей"
+
+    def __str__(self):
+        return f"Статистика {self.user}"
+
+
+class TrendingScore(models.Model):
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True,
+                                related_name="trending", verbose_name="Пост")
+    # Копия post.group_id, чтобы топ сообщества читался по одному индексу.
+    group = models.ForeignKey(Group, null=True, blank=True, on_delete=models.CASCADE,
+                              related_name="+", verbose_name="Сообщество")
+    score = models.FloatField(verbose_name="Популярность")
+
+    class Meta:
+        verbose_name = "Популярность поста"
+        verbose_name_plural = "Популярность постов"
+        indexes = [
+            models.Index(fields=["-score"], name="trending_score"),
+            models.Index(fields=["group", "-score"], name="trending_group_score"),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id}: {self.score:.3f}"
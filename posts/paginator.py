@@ -0,0 +1,171 @@
+"""Постраничная навигация по курсору (keyset pagination).
+
+Вместо OFFSET и COUNT(*) страница выбирается условием по индексированным
+полям сортировки, поэтому стоимость страницы не зависит от её глубины.
+Старые ссылки вида ?page=N обслуживает обычный Paginator.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+PER_PAGE = 10
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    cursor_mode = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    def __init__(self, queryset, per_page=PER_PAGE,
+                 ordering=("-pub_date", "-id")):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.fields = [name.lstrip("-") for name in ordering]
+
+    def _field(self, name):
+        meta = self.queryset.model._meta
+        return meta.pk if name == "pk" else meta.get_field(name)
+
+    def encode(self, item, direction):
+        values = []
+        for name in self.fields:
+            value = item[name] if isinstance(item, dict) else getattr(item, name)
+            values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        raw = json.dumps([direction] + values).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode(self, cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, values = data[0], data[1:]
+            if direction not in ("next", "prev") or len(values) != len(self.fields):
+                raise ValueError(cursor)
+            values = [self._field(name).to_python(value)
+                      for name, value in zip(self.fields, values)]
+        except (ValueError, TypeError, LookupError, ValidationError):
+            raise InvalidCursor(cursor)
+        return direction, values
+
+    def _seek(self, values, reverse):
+        condition = Q()
+        for position, name in enumerate(self.ordering):
+            descending = name.startswith("-") != reverse
+            lookup = "lt" if descending else "gt"
+            field = self.fields[position]
+            step = Q(**{f"{field}__{lookup}": values[position]})
+            for previous, value in zip(self.fields[:position], values):
+                step &= Q(**{previous: value})
+            condition |= step
+        return condition
+
+    def _slice(self, values, reverse):
+        ordering = self.ordering
+        if reverse:
+            ordering = [name[1:] if name.startswith("-") else f"-{name}"
+                        for name in ordering]
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, reverse))
+        return queryset[:self.per_page + 1]
+
+    def _iterate(self, values):
+        return self._slice(values, False).iterator()
+
+    def page(self, cursor=None):
+        if not cursor:
+            direction, values = "next", None
+        else:
+            direction, values = self.decode(cursor)
+        reverse = direction == "prev"
+        items = list(self._slice(values, reverse))
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if reverse:
+            items.reverse()
+        next_cursor = previous_cursor = None
+        if items:
+            if has_more or reverse:
+                next_cursor = self.encode(items[-1], "next")
+            if (values is not None and not reverse) or (reverse and has_more):
+                previous_cursor = self.encode(items[0], "prev")
+        return CursorPage(items, next_cursor, previous_cursor)
+
+    def get_page(self, cursor=None):
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+    def stream(self, cursor=None):
+        """(items, page): объекты страницы по одному из .iterator() и сама страница.
+
+        Курсоры page заполняются, когда items прочитан до конца. Страница
+        «назад» читается в обратном порядке, её по-прежнему собираем списком.
+        """
+        try:
+            direction, values = self.decode(cursor) if cursor else ("next", None)
+        except InvalidCursor:
+            direction, values = "next", None
+        if direction == "prev":
+            page = self.page(cursor)
+            return iter(page.object_list), page
+
+        page = CursorPage([], None, None)
+
+        def items():
+            first = last = None
+            for number, item in enumerate(self._iterate(values)):
+                if number == self.per_page:
+                    page.next_cursor = self.encode(last, "next")
+                    break
+                if first is None:
+                    first = item
+                last = item
+                yield item
+            if values is not None and first is not None:
+                page.previous_cursor = self.encode(first, "prev")
+        return items(), page
+
+
+def paginate(request, queryset, per_page=PER_PAGE, ordering=("-pub_date", "-id"),
+             paginator_class=CursorPaginator):
+    """Возвращает (page, paginator) для шаблона.
+
+    Если в запросе есть ?page=, используется обычный Paginator, чтобы не
+    ломать старые ссылки; иначе страница выбирается по ?cursor=.
+    Ленты с собственным paginator_class листаются только курсором.
+    """
+    if "page" in request.GET and paginator_class is CursorPaginator:
+        paginator = Paginator(queryset.order_by(*ordering), per_page)
+        return paginator.get_page(request.GET.get("page")), paginator
+    paginator = paginator_class(queryset, per_page, ordering)
+    return paginator.get_page(request.GET.get("cursor")), paginator
@@ -0,0 +1,185 @@
+"""Полнотекстовый поиск по постам и комментариям.
+
+На SQLite используется индекс FTS5: таблицы posts_post_fts и
+posts_comment_fts (rowid совпадает с id поста или комментария)
+обновляются из сигналов при сохранении и удалении, а выдача ранжируется
+по bm25. На PostgreSQL ищем через to_tsvector/to_tsquery по GIN-индексам
+из миграции 0014 и ранжируем по ts_rank. Другие базы не поддерживаются.
+"""
+import base64
+import json
+import re
+
+from django.db import NotSupportedError, connection
+from django.db.models.expressions import RawSQL
+
+from posts.models import Post
+from posts.paginator import CursorPage, InvalidCursor, PER_PAGE
+
+# Совпадение в комментарии весит вдвое меньше совпадения в тексте поста.
+COMMENT_WEIGHT = 0.5
+
+# Конфигурация должна совпадать с выражением GIN-индексов в миграции 0014.
+PG_CONFIG = "russian"
+
+
+def enabled():
+    return connection.vendor == "sqlite"
+
+
+def postgres():
+    return connection.vendor == "postgresql"
+
+
+def words(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def match_expression(query):
+    """Превращает ввод пользователя в безопасный запрос FTS5: все слова, по префиксу."""
+    return " ".join(f'"{word}"*' for word in words(query))
+
+
+def tsquery_expression(query):
+    """То же для to_tsquery: все слова, по префиксу."""
+    return " & ".join(f"{word}:*" for word in words(query))
+
+
+def index_post(post):
+    if enabled():
+        _replace("posts_post_fts", post.pk, post.text)
+
+
+def index_comment(comment):
+    if enabled():
+        _replace("posts_comment_fts", comment.pk, comment.text, comment.post_id)
+
+
+def unindex_post(post_id):
+    if enabled():
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM posts_post_fts WHERE rowid = %s", [post_id])
+            cursor.execute("DELETE FROM posts_comment_fts WHERE post_id = %s", [post_id])
+
+
+def unindex_comment(comment_id):
+    if enabled():
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM posts_comment_fts WHERE rowid = %s", [comment_id])
+
+
+def _replace(table, rowid, text, post_id=None):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [rowid])
+        if post_id is None:
+            cursor.execute(f"INSERT INTO {table} (rowid, text) VALUES (%s, %s)",
+                           [rowid, text])
+        else:
+            cursor.execute(f"INSERT INTO {table} (rowid, text, post_id) VALUES (%s, %s, %s)",
+                           [rowid, text, post_id])
+
+
+def rebuild():
+    if not enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM posts_post_fts")
+        cursor.execute("DELETE FROM posts_comment_fts")
+        cursor.execute("INSERT INTO posts_post_fts (rowid, text) "
+                       "SELECT id, text FROM posts_post")
+        cursor.execute("INSERT INTO posts_comment_fts (rowid, text, post_id) "
+                       "SELECT id, text, post_id FROM posts_comment "
+                       "WHERE post_id IS NOT NULL")
+        cursor.execute("INSERT INTO posts_post_fts (posts_post_fts) VALUES ('optimize')")
+        cursor.execute("INSERT INTO posts_comment_fts (posts_comment_fts) VALUES ('optimize')")
+        cursor.execute("SELECT COUNT(*) FROM posts_post_fts")
+        return cursor.fetchone()[0]
+
+
+class SearchPaginator:
+    """Страницы выдачи по курсору (score, id): глубина не влияет на цену страницы."""
+
+    def __init__(self, query, per_page=PER_PAGE):
+        self.query = query
+        self.per_page = per_page
+
+    def encode(self, score, post_id):
+        raw = json.dumps([score, post_id]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode(self, cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            score, post_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return float(score), int(post_id)
+        except (ValueError, TypeError):
+            raise InvalidCursor(cursor)
+
+    def ranked_ids(self, match, after, limit):
+        if postgres():
+            return self.ranked_ids_postgres(tsquery_expression(self.query), after, limit)
+        sql = (
+            "SELECT post_id, MIN(score) AS best FROM ("
+            " SELECT rowid AS post_id, bm25(posts_post_fts) AS score"
+            " FROM posts_post_fts WHERE posts_post_fts MATCH %s"
+            " UNION ALL"
+            " SELECT post_id, bm25(posts_comment_fts) * %s AS score"
+            " FROM posts_comment_fts WHERE posts_comment_fts MATCH %s"
+            ") GROUP BY post_id"
+        )
+        return self._fetch(sql, [match, COMMENT_WEIGHT, match], after, limit)
+
+    def ranked_ids_postgres(self, match, after, limit):
+        # Отрицательный ts_rank упорядочен так же, как bm25: меньше — лучше.
+        vector = f"to_tsvector('{PG_CONFIG}', text)"
+        tsquery = f"to_tsquery('{PG_CONFIG}', %s)"
+        sql = (
+            "SELECT post_id, MIN(score) AS best FROM ("
+            f" SELECT id AS post_id, -ts_rank({vector}, {tsquery}) AS score"
+            f" FROM posts_post WHERE {vector} @@ {tsquery}"
+            " UNION ALL"
+            f" SELECT post_id, -ts_rank({vector}, {tsquery}) * %s AS score"
+            f" FROM posts_comment WHERE {vector} @@ {tsquery}"
+            " AND post_id IS NOT NULL"
+            ") found GROUP BY post_id"
+        )
+        return self._fetch(sql, [match, match, match, COMMENT_WEIGHT, match], after, limit)
+
+    def _fetch(self, sql, params, after, limit):
+        if after is not None:
+            sql += " HAVING MIN(score) > %s OR (MIN(score) = %s AND post_id > %s)"
+            params += [after[0], after[0], after[1]]
+        sql += " ORDER BY best, post_id LIMIT %s"
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def get_page(self, cursor=None):
+        match = match_expression(self.query)
+        if not match:
+            return CursorPage([], None, None)
+        if not (enabled() or postgres()):
+            raise NotSupportedError(
+                f"Полнотекстовый поиск не поддерживается для {connection.vendor}"
+            )
+        try:
+            after = self.decode(cursor) if cursor else None
+        except InvalidCursor:
+            after = None
+        rows = self.ranked_ids(match, after, self.per_page + 1)
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        posts = Post.objects.for_feed().in_bulk([post_id for post_id, _ in rows])
+        items = [posts[post_id] for post_id, _ in rows if post_id in posts]
+        next_cursor = self.encode(rows[-1][1], rows[-1][0]) if has_next else None
+        return CursorPage(items, next_cursor, None)
+
+
+def admin_filter(queryset, term, table):
+    """Сужает queryset админки до строк, найденных в индексе table."""
+    match = match_expression(term)
+    if not match:
+        return queryset
+    found = RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [match])
+    return queryset.filter(pk__in=found)
@@ -0,0 +1,174 @@
+import threading
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from posts import caching, counters, follows, search, timeline, trending
+from posts.models import Comment, Follow, Group, Post
+
+# Посты, удаляемые в этом потоке: их комментарии уходят каскадом, и
+# обновлять счётчик и кэш поста для каждого из них незачем.
+_deleting = threading.local()
+
+
+def deleting_posts():
+    if not hasattr(_deleting, "posts"):
+        _deleting.posts = set()
+    return _deleting.posts
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, **kwargs):
+    instance._previous_group_id = None
+    if instance.pk is not None:
+        instance.version += 1
+        instance._previous_group_id = (Post.objects.filter(pk=instance.pk)
+                                       .values_list("group_id", flat=True).first())
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, "posts_count", 1)
+        timeline.fan_out(instance)
+        trending.post_created(instance)
+    search.index_post(instance)
+    caching.bump(*caching.feeds_for_post(instance))
+    previous_group_id = getattr(instance, "_previous_group_id", None)
+    if previous_group_id not in (None, instance.group_id):
+        slug = Group.objects.filter(pk=previous_group_id).values_list("slug", flat=True).first()
+        caching.bump(f"group:{slug}", f"trending:{slug}")
+    if not created and previous_group_id != instance.group_id:
+        trending.post_moved(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    # Внешний ключ комментария допускает NULL, поэтому Django может удалить
+    # пост раньше комментариев: забываем id только после коммита.
+    posts = deleting_posts()
+    transaction.on_commit(lambda: posts.discard(instance.pk))
+    counters.change_user(instance.author_id, "posts_count", -1)
+    search.unindex_post(instance.pk)
+    caching.bump(*caching.feeds_for_post(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comments(instance.post_id, 1)
+        trending.comment_added(instance)
+    search.index_comment(instance)
+    caching.bump(*caching.feeds_for_post(instance.post))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # Индекс комментариев поста чистит search.unindex_post одним запросом.
+    if instance.post_id in deleting_posts():
+        return
+    counters.change_comments(instance.post_id, -1)
+    search.unindex_comment(instance.pk)
+    post = Post.objects.filter(pk=instance.post_id).first()
+    if post is not None:
+        caching.bump(*caching.feeds_for_post(post))
+
+
+def group_feeds(slug):
+    return [f"group:{slug}", f"trending:{slug}"]
+
+
+def touch_posts(**filters):
+    # Карточки постов показывают сообщество и автора, а их ключ — только
+    # версию поста: меняем её, чтобы карточки перерисовались.
+    Post.objects.filter(**filters).update(version=F("version") + 1)
+
+
+@receiver(pre_save, sender=Group)
+def group_changing(sender, instance, **kwargs):
+    instance._posts_stale = False
+    if instance.pk is None:
+        return
+    previous = Group.objects.filter(pk=instance.pk).values_list("slug", "title").first()
+    if previous is None:
+        return
+    slug, title = previous
+    if slug != instance.slug:
+        caching.forget(*group_feeds(slug))
+    instance._posts_stale = (slug, title) != (instance.slug, instance.title)
+
+
+@receiver(post_save, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    if getattr(instance, "_posts_stale", False):
+        touch_posts(group=instance)
+        # Название сообщества есть и в карточках на страницах авторов.
+        usernames = (User.objects.filter(posts__group=instance).order_by()
+                     .values_list("username", flat=True).distinct())
+        caching.bump("trending", *(f"profile:{username}" for username in usernames))
+    caching.bump("index", *group_feeds(instance.slug))
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    caching.bump("index")
+    caching.forget(*group_feeds(instance.slug))
+
+
+@receiver(pre_save, sender=User)
+def user_changing(sender, instance, update_fields=None, **kwargs):
+    instance._posts_stale = False
+    # Вход сохраняет только last_login: имя при этом не меняется.
+    if instance.pk is None or (update_fields is not None and "username" not in update_fields):
+        return
+    username = User.objects.filter(pk=instance.pk).values_list("username", flat=True).first()
+    if username not in (None, instance.username):
+        caching.forget(f"profile:{username}")
+        instance._posts_stale = True
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, **kwargs):
+    if getattr(instance, "_posts_stale", False):
+        touch_posts(author=instance)
+        # Имя автора есть в карточках общих лент и лент его сообществ.
+        slugs = (Group.objects.filter(posts__author=instance).order_by()
+                 .values_list("slug", flat=True).distinct())
+        caching.bump("index", "trending", *(name for slug in slugs for name in group_feeds(slug)))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    caching.forget(f"profile:{instance.username}")
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, "followers_count", 1)
+        counters.change_user(instance.user_id, "following_count", 1)
+        follows.invalidate(instance.user_id)
+        timeline.backfill(instance.user, instance.author)
+        caching.bump(f"profile:{instance.author.username}",
+                     f"profile:{instance.user.username}")
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, "followers_count", -1)
+    counters.change_user(instance.user_id, "following_count", -1)
+    follows.invalidate(instance.user_id)
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.follower_lost(instance.author_id)
+    # При каскадном удалении пользователя его строки уже может не быть.
+    usernames = (User.objects.filter(pk__in=[instance.user_id, instance.author_id])
+                 .values_list("username", flat=True))
+    caching.bump(*(f"profile:{username}" for username in usernames))
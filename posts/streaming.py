@@ -0,0 +1,40 @@
+"""Потоковый рендеринг лент (STREAM_FEEDS).
+
+Всё, что до карточек (head со ссылками на CSS и JS, навигация, шапка
+профиля), отдаётся первым куском, ещё до запроса за постами, и браузер
+начинает грузить статику, пока сервер рендерит страницу. Дальше по
+карточке на пост по мере чтения через .iterator() и в конце хвост с
+пагинацией. Шаблон ленты рендерится дважды: сначала с пустой страницей
+(от него нужна часть до метки post_cards), потом с настоящей (часть
+после метки). Запросы при отдаче потока идут уже после middleware и не
+попадают в метрики запроса.
+"""
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
+
+from posts.paginator import CursorPage
+from posts.templatetags.post_tags import STREAM_MARKER, post_cards
+
+
+def enabled(request):
+    # Старые ссылки ?page=N обслуживает обычный Paginator, он считает COUNT(*).
+    return getattr(settings, "STREAM_FEEDS", False) and "page" not in request.GET
+
+
+def render_stream(request, template_name, context, paginator):
+    items, page = paginator.stream(request.GET.get("cursor"))
+
+    def part(current_page, index):
+        html = render_to_string(template_name, {**context, "page": current_page,
+                                                "paginator": paginator,
+                                                "stream_cards": True}, request)
+        return html.split(STREAM_MARKER, 1)[index]
+
+    def content():
+        yield part(CursorPage([], None, None), 0)
+        for post in items:
+            yield post_cards({"user": request.user}, [post])
+        yield part(page, 1)
+
+    return StreamingHttpResponse(content(), content_type="text/html; charset=utf-8")
@@ -0,0 +1,56 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts import thumbnails
+
+register = template.Library()
+
+CARD_TIMEOUT = getattr(settings, "POST_CARD_TIMEOUT", 60 * 60 * 24)
+# При потоковом рендеринге карточки вставляются на место этой метки.
+STREAM_MARKER = "<!-- post-cards -->"
+
+
+def card_key(post, user):
+    is_author = user.is_authenticated and user.pk == post.author_id
+    return f"post-card:{post.pk}:{post.version}:{int(is_author)}"
+
+
+def render_card(post, user):
+    return render_to_string("post_item.html", {"post": post, "user": user})
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """Карточки постов ленты; готовые берутся из кэша одним запросом.
+
+    Ключ карточки включает версию поста, которая растёт при правке поста,
+    при изменении числа комментариев и при переименовании его сообщества
+    или автора, поэтому кэш сбрасывать не нужно.
+    """
+    if context.get("stream_cards"):
+        return mark_safe(STREAM_MARKER)
+    user = context["user"]
+    posts = list(posts)
+    keys = [card_key(post, user) for post in posts]
+    cards = cache.get_many(keys)
+    missing = {}
+    for key, post in zip(keys, posts):
+        if key not in cards:
+            cards[key] = missing[key] = render_card(post, user)
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+    return mark_safe("".join(cards[key] for key in keys))
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    return post_cards(context, [post])
+
+
+@register.simple_tag
+def post_thumbnail(image, size):
+    """Готовая миниатюра или None, пока она строится в фоне."""
+    return thumbnails.lookup(image, size)
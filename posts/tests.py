@@ -1,16 +1,79 @@
-from django.test import TestCase
-from django.contrib.auth.models import User
-from django.test import Client
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.db import IntegrityError, NotSupportedError, connection, transaction
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
 from django.shortcuts import get_object_or_404
+from django.template import Context, Template
 from django.urls import reverse
+from django.utils import timezone
+from django.conf import settings
+from datetime import timedelta
+from io import BytesIO, StringIO
+import asyncio
+import gzip
+import importlib
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+from unittest import mock
+from wsgiref.util import setup_testing_defaults
 import uuid
+import zlib
 
-from posts.models import Post, Group
+from PIL import Image as PILImage
 
+from posts import admin, caching, concurrency, follows, search, thumbnails, timeline, trending, views
+from posts.models import (Post, Group, Comment, Follow, TimelineEntry, TrendingScore,
+                          UserStats)
+from posts.paginator import CursorPaginator
+from yatube import asgi, db, metrics, staticfiles
+from yatube.querycheck import QueryBudgetMixin, capture
+from yatube.sqlite_cache import SQLiteCache
 
-class ProfileTest(TestCase):
-    cache_text = []
+# Картинка и «не картинка» для загрузок в тестах.
+TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testdata")
 
+
+class CacheIsolatedTestCase(QueryBudgetMixin, TestCase):
+    """Очищает кэш перед каждым тестом.
+
+    Ключи кэша строятся по id, а после отката транзакции теста id
+    в базе выдаются заново.
+    """
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        cache.clear()
+
+
+class TempMediaMixin:
+    """MEDIA_ROOT во временном каталоге на время всего класса тестов."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        # Фоновые миниатюры пишут в тот же каталог.
+        thumbnails.wait()
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class ProfileTest(TempMediaMixin, CacheIsolatedTestCase):
     def setUp(self):
         self.client = Client()
         self.username = uuid.uuid4().hex
@@ -31,7 +94,6 @@ class ProfileTest(TestCase):
         self.post = Post.objects.create(text=self.text, author=self.user, group=self.group)
         self.client.force_login(self.user)
         self.page_not_found = uuid.uuid4().hex
-        self.cache_text.append(self.text)
 
     def test_profile(self):
         response_profile = self.client.get(reverse("profile", args=[self.user.username]))
@@ -52,7 +114,7 @@ class ProfileTest(TestCase):
 
     def test_post_pub(self):
         response_post_index = self.client.get(reverse("index"))
-        self.assertContains(response_post_index, self.cache_text[0], count=None, status_code=200, html=False)
+        self.assertContains(response_post_index, self.text, count=None, status_code=200, html=False)
         response_post_user = self.client.get(reverse("profile", args=[self.user.username]))
         self.assertContains(response_post_user, self.text, count=None, status_code=200, html=False)
         response_post = self.client.get(reverse("post", args=[self.user.username, self.post.pk]))
@@ -66,7 +128,7 @@ class ProfileTest(TestCase):
         edit_post = Post.objects.get(pk=self.post.pk)
         self.assertEqual(edit_post.text, self.text_edit)
         response_post_edit_index = self.client.get(reverse("index"))
-        self.assertContains(response_post_edit_index, self.cache_text[0], count=None, status_code=200, html=False)
+        self.assertContains(response_post_edit_index, self.text_edit, count=1, status_code=200, html=False)
         response_post_edit_user = self.client.get(reverse("profile", args=[self.user.username]))
         self.assertContains(response_post_edit_user, self.text_edit, count=1, status_code=200, html=False)
         response_post_edit = self.client.get(reverse("post", args=[self.user.username, self.post.pk]))
@@ -82,12 +144,19 @@ class ProfileTest(TestCase):
                                                          {"text": self.text_edit, "group": self.group.pk}, follow=True)
         self.assertEqual(response_post_edit_not_author.redirect_chain, [(f"/{self.user.username}/{self.post.pk}/", 302)])
 
+    def test_post_edit_wrong_username(self):
+        response = self.client.post(reverse("post_edit", args=[self.username_not_author, self.post.pk]),
+                                    {"text": self.text_edit, "group": self.group.pk})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).text, self.text)
+
     def test_page_not_found(self):
         response_page_not_found = self.client.get(f"/{self.page_not_found}/")
         self.assertEqual(response_page_not_found.status_code, 404)
 
+    @override_settings(THUMBNAIL_WORKERS=0)
     def test_image(self):
-        with open('media/1.png', 'rb') as img:
+        with open(os.path.join(TESTDATA, '1.png'), 'rb') as img:
             self.client.post(reverse("post_edit", args=[self.user.username, self.post.pk]),
                              {"text": self.text_edit, "group": self.group.pk, 'image': img}, follow=True)
         pages = [
@@ -100,7 +169,7 @@ class ProfileTest(TestCase):
             self.assertIn(bytes("""<img class="card-img" src="/media/cache/""", encoding="UTF-8"), response_page.content)
 
     def test_not_image(self):
-        with open('media/1.txt', 'rb') as img:
+        with open(os.path.join(TESTDATA, '1.txt'), 'rb') as img:
             self.client.post(reverse("post_edit", args=[self.user.username, self.post.pk]),
                          {"text": self.text_edit, "group": self.group.pk, 'image': img}, follow=True)
         pages = [
@@ -114,15 +183,19 @@ class ProfileTest(TestCase):
 
     def test_cache(self):
         response_index = self.client.get(reverse("index"))
-        self.assertContains(response_index, self.cache_text[0], count=None, status_code=200, html=False)
+        self.assertContains(response_index, self.text, count=None, status_code=200, html=False)
+        hits = caching.stats()["hits"]
+        response_cached_index = self.client.get(reverse("index"))
+        self.assertEqual(response_cached_index.content, response_index.content)
+        self.assertEqual(caching.stats()["hits"], hits + 1)
         self.client.post(reverse("post_edit", args=[self.user.username, self.post.pk]),
                          {"text": self.text_edit, "group": self.group.pk}, follow=True)
         response_cache_post_edit_index = self.client.get(reverse("index"))
-        self.assertContains(response_cache_post_edit_index, self.text, count=None, status_code=200, html=False)
-        self.assertNotContains(response_cache_post_edit_index, self.text_edit, status_code=200, html=False)
+        self.assertContains(response_cache_post_edit_index, self.text_edit, count=None, status_code=200, html=False)
+        self.assertNotContains(response_cache_post_edit_index, self.text, status_code=200, html=False)
 
 
-class FollowCommentTest(TestCase):
+class FollowCommentTest(CacheIsolatedTestCase):
     def setUp(self):
         self.client = Client()
         self.username = uuid.uuid4().hex
@@ -162,6 +235,7 @@ class FollowCommentTest(TestCase):
         self.client.post(reverse("profile_follow", args=[self.user.username]), {"username": self.user.username}, follow=True)
         response_follow = self.client.get(reverse("follow_index"))
         self.assertContains(response_follow, self.text, count=None, status_code=200, html=False)
+        self.assertContains(response_follow, '<a class="nav-link active" href="/follow">')
         self.client.force_login(self.user_not_follow)
         response_not_follow = self.client.get(reverse("follow_index"))
         self.assertNotContains(response_not_follow, self.text, status_code=200, html=False)
@@ -177,3 +251,1275 @@ class FollowCommentTest(TestCase):
         response_post_comment = self.client.get(reverse("post", args=[self.user.username, self.post.pk]))
         self.assertContains(response_post_comment, self.text, count=2, status_code=200, html=False)
 
+
+
+class TimelineTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=uuid.uuid4().hex)
+        self.reader = User.objects.create_user(username=uuid.uuid4().hex)
+        self.old_text = uuid.uuid4().hex
+        self.old_post = Post.objects.create(text=self.old_text, author=self.author)
+        self.client.force_login(self.reader)
+
+    def test_fan_out_and_backfill(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=self.old_post).exists())
+        new_post = Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=new_post).exists())
+        response = self.client.get(reverse("follow_index"))
+        self.assertContains(response, new_post.text)
+        self.assertContains(response, self.old_text)
+
+    def test_unfollow_prunes(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.filter(user=self.reader, author=self.author).delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+        response = self.client.get(reverse("follow_index"))
+        self.assertNotContains(response, self.old_text)
+
+    def test_celebrity_merged_on_read(self):
+        with mock.patch.object(timeline, "FANOUT_LIMIT", 1):
+            Follow.objects.create(user=self.reader, author=self.author)
+            new_post = Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+            self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+            response = self.client.get(reverse("follow_index"))
+        self.assertContains(response, new_post.text)
+        self.assertContains(response, self.old_text)
+
+    def test_pages_merge_celebrities(self):
+        celebrity = User.objects.create_user(username=uuid.uuid4().hex)
+        fan = User.objects.create_user(username=uuid.uuid4().hex)
+        with mock.patch.object(timeline, "FANOUT_LIMIT", 2):
+            Follow.objects.create(user=self.reader, author=self.author)
+            Follow.objects.create(user=fan, author=celebrity)
+            Follow.objects.create(user=self.reader, author=celebrity)
+            posts = [self.old_post]
+            for number in range(24):
+                author = celebrity if number % 3 else self.author
+                posts.append(Post.objects.create(text=uuid.uuid4().hex, author=author))
+            self.assertFalse(TimelineEntry.objects.filter(post__author=celebrity).exists())
+            seen, cursor, pages = [], None, []
+            while True:
+                page = timeline.TimelinePaginator(self.reader, Post.objects.for_feed()).page(cursor)
+                seen += [post.pk for post in page]
+                pages.append(page)
+                if not page.has_next():
+                    break
+                cursor = page.next_cursor
+            back = timeline.TimelinePaginator(self.reader, Post.objects.all()).page(
+                pages[2].previous_cursor)
+        self.assertEqual(seen, sorted((post.pk for post in posts), reverse=True))
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(list(back), list(pages[1]))
+
+    def test_trim(self):
+        with mock.patch.object(timeline, "SIZE", 3):
+            posts = [Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+                     for _ in range(4)]
+            Follow.objects.create(user=self.reader, author=self.author)
+        kept = TimelineEntry.objects.filter(user=self.reader).values_list("post", flat=True)
+        self.assertEqual(sorted(kept), sorted(post.pk for post in posts[1:]))
+
+    def test_fan_out_trims_overgrown_timelines(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        entries = TimelineEntry.objects.filter(user=self.reader)
+        sizes = []
+        with mock.patch.object(timeline, "SIZE", 3), mock.patch.object(timeline, "TRIM_EVERY", 2):
+            for _ in range(6):
+                latest = Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+                sizes.append(entries.count())
+        # Лента растёт до SIZE + TRIM_EVERY и обрезается до SIZE, независимо от id постов.
+        self.assertEqual(sizes, [2, 3, 4, 5, 3, 4])
+        self.assertEqual(entries.order_by("-pub_date").first().post, latest)
+
+    def test_backfill_when_celebrity_loses_followers(self):
+        fan = User.objects.create_user(username=uuid.uuid4().hex)
+        with mock.patch.object(timeline, "FANOUT_LIMIT", 2):
+            Follow.objects.create(user=self.reader, author=self.author)
+            Follow.objects.create(user=fan, author=self.author)
+            new_post = Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+            self.assertFalse(TimelineEntry.objects.filter(post=new_post).exists())
+            Follow.objects.filter(user=fan).delete()
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=new_post).exists())
+
+
+class CursorPaginatorTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=uuid.uuid4().hex)
+        self.group = Group.objects.create(title=uuid.uuid4().hex, slug=uuid.uuid4().hex,
+                                          description=uuid.uuid4().hex)
+        self.posts = [Post.objects.create(text=uuid.uuid4().hex, author=self.user, group=self.group)
+                      for _ in range(25)]
+
+    def test_walk_forward_and_back(self):
+        url = reverse("group", args=[self.group.slug])
+        response = self.client.get(url)
+        seen = [post.pk for post in response.context["page"]]
+        pages = [response.context["page"]]
+        while response.context["page"].has_next():
+            response = self.client.get(url, {"cursor": response.context["page"].next_cursor})
+            seen += [post.pk for post in response.context["page"]]
+            pages.append(response.context["page"])
+        self.assertEqual(seen, sorted((post.pk for post in self.posts), reverse=True))
+        self.assertEqual(len(pages), 3)
+        self.assertFalse(pages[0].has_previous())
+        response = self.client.get(url, {"cursor": pages[1].previous_cursor})
+        self.assertEqual([post.pk for post in response.context["page"]], [post.pk for post in pages[0]])
+        self.assertFalse(response.context["page"].has_previous())
+
+    def test_legacy_page_numbers(self):
+        response = self.client.get(reverse("group", args=[self.group.slug]), {"page": 3})
+        self.assertEqual(response.context["page"].number, 3)
+        self.assertEqual(len(response.context["page"]), 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("group", args=[self.group.slug]), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), 10)
+
+
+class FeedQueryCountTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=uuid.uuid4().hex)
+        self.group = Group.objects.create(title=uuid.uuid4().hex, slug=uuid.uuid4().hex,
+                                          description=uuid.uuid4().hex)
+        self.client.force_login(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        post = Post.objects.create(text=uuid.uuid4().hex, author=self.user, group=self.group)
+        Comment.objects.create(post=post, author=self.user, text=uuid.uuid4().hex)
+        urls = [
+            reverse("group", args=[self.group.slug]),
+            reverse("profile", args=[self.user.username]),
+        ]
+        single = [self.count_queries(url) for url in urls]
+        for _ in range(9):
+            post = Post.objects.create(text=uuid.uuid4().hex, author=self.user, group=self.group)
+            Comment.objects.create(post=post, author=self.user, text=uuid.uuid4().hex)
+        self.assertEqual([self.count_queries(url) for url in urls], single)
+
+    def test_view_query_budgets(self):
+        author = User.objects.create_user(username=uuid.uuid4().hex)
+        Follow.objects.create(user=self.user, author=author)
+        for number in range(5):
+            post = Post.objects.create(text=uuid.uuid4().hex, author=author, group=self.group)
+            Comment.objects.create(post=post, author=self.user, text=uuid.uuid4().hex)
+        # Сессия и пользователь плюс запросы самой страницы; кэш пуст.
+        budgets = [
+            (reverse("index"), 3),
+            (reverse("group", args=[self.group.slug]), 4),
+            (reverse("profile", args=[author.username]), 6),
+            # Плюс список «звёзд» среди подписок, один на запрос.
+            (reverse("follow_index"), 5),
+        ]
+        for url, budget in budgets:
+            with self.subTest(url=url):
+                cache.clear()
+                with self.assertQueryBudget(budget, repeats=1):
+                    self.client.get(url)
+
+
+class CountersTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=uuid.uuid4().hex)
+        self.reader = User.objects.create_user(username=uuid.uuid4().hex)
+        self.post = Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Comment.objects.create(post=self.post, author=self.reader, text=uuid.uuid4().hex)
+
+    def test_counters_follow_writes(self):
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual((stats.followers_count, stats.following_count, stats.posts_count), (1, 0, 1))
+        self.assertEqual(UserStats.objects.get(user=self.reader).following_count, 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comments_count, 1)
+        Comment.objects.all().delete()
+        Follow.objects.all().delete()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comments_count, 0)
+        self.assertEqual(UserStats.objects.get(user=self.author).followers_count, 0)
+
+    def test_profile_without_count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("profile", args=[self.author.username]))
+        self.assertContains(response, "Подписчиков: 1")
+        self.assertContains(response, "Записей: 1")
+        self.assertFalse([query for query in context.captured_queries if "COUNT(" in query["sql"]])
+
+    def test_rebuild_counters(self):
+        UserStats.objects.update(followers_count=42, posts_count=42)
+        Post.objects.update(comments_count=42)
+        call_command("rebuild_counters", stdout=StringIO())
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual((stats.followers_count, stats.posts_count), (1, 1))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comments_count, 1)
+
+    def test_post_delete_does_not_touch_post_per_comment(self):
+        def delete_queries(comments):
+            post = Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+            for _ in range(comments):
+                Comment.objects.create(post=post, author=self.reader, text=uuid.uuid4().hex)
+            with CaptureQueriesContext(connection) as context:
+                post.delete()
+            return len(context.captured_queries)
+
+        self.assertEqual(delete_queries(20), delete_queries(1))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM posts_comment_fts")
+            self.assertEqual(cursor.fetchone()[0], Comment.objects.count())
+
+
+class FollowStateTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=uuid.uuid4().hex)
+        self.reader = User.objects.create_user(username=uuid.uuid4().hex)
+        self.client.force_login(self.reader)
+
+    def test_follow_is_idempotent(self):
+        for _ in range(2):
+            self.client.get(reverse("profile_follow", args=[self.author.username]))
+        self.assertEqual(Follow.objects.filter(user=self.reader, author=self.author).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_follow_state_cache_invalidated(self):
+        self.assertFalse(follows.is_following(self.reader, self.author))
+        self.client.get(reverse("profile_follow", args=[self.author.username]))
+        self.assertTrue(follows.is_following(self.reader, self.author))
+        response = self.client.get(reverse("profile", args=[self.author.username]))
+        self.assertTrue(response.context["follow"])
+        self.client.get(reverse("profile_unfollow", args=[self.author.username]))
+        self.assertFalse(follows.is_following(self.reader, self.author))
+
+    def test_follow_state_without_cache(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        with mock.patch.object(follows, "FOLLOW_SET_CACHE", False):
+            self.assertTrue(follows.is_following(self.reader, self.author))
+
+
+class FeedCacheTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=uuid.uuid4().hex)
+        self.group = Group.objects.create(title=uuid.uuid4().hex, slug=uuid.uuid4().hex,
+                                          description=uuid.uuid4().hex)
+        self.post = Post.objects.create(text=uuid.uuid4().hex, author=self.user, group=self.group)
+
+    def test_comment_invalidates_group_and_profile(self):
+        pages = [reverse("group", args=[self.group.slug]), reverse("profile", args=[self.user.username])]
+        for page in pages:
+            self.assertContains(self.client.get(page), "Добавить комментарий")
+        Comment.objects.create(post=self.post, author=self.user, text=uuid.uuid4().hex)
+        for page in pages:
+            self.assertContains(self.client.get(page), "1 комментариев")
+
+    def test_group_change_invalidates_both_groups(self):
+        other = Group.objects.create(title=uuid.uuid4().hex, slug=uuid.uuid4().hex,
+                                     description=uuid.uuid4().hex)
+        self.assertContains(self.client.get(reverse("group", args=[self.group.slug])), self.post.text)
+        self.post.group = other
+        self.post.save()
+        self.assertNotContains(self.client.get(reverse("group", args=[self.group.slug])), self.post.text)
+        self.assertContains(self.client.get(reverse("group", args=[other.slug])), self.post.text)
+
+    def test_missing_feed_creates_no_generation(self):
+        slug = uuid.uuid4().hex
+        response = self.client.get(reverse("group", args=[slug]))
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(cache.get(caching.generation_key(f"group:{slug}")))
+
+    def test_generation_started_by_first_page(self):
+        name = f"profile:{self.user.username}"
+        cache.delete(caching.generation_key(name))
+        url = reverse("profile", args=[self.user.username])
+        etag = self.client.get(url)["ETag"]
+        self.assertIsNotNone(caching.generation(name))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_deleted_group_has_no_etag(self):
+        url = reverse("group", args=[self.group.slug])
+        etag = self.client.get(url)["ETag"]
+        self.group.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_renamed_user_has_no_etag(self):
+        url = reverse("profile", args=[self.user.username])
+        etag = self.client.get(url)["ETag"]
+        self.user.username = uuid.uuid4().hex
+        self.user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class SQLiteCacheTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(f"{self.directory}/cache.sqlite3", {"OPTIONS": options})
+
+    def test_basic_operations(self):
+        cache = self.make_cache()
+        cache.set("key", {"value": 1})
+        self.assertEqual(cache.get("key"), {"value": 1})
+        self.assertFalse(cache.add("key", 2))
+        self.assertTrue(cache.add("counter", 1))
+        self.assertEqual(cache.incr("counter", 5), 6)
+        with self.assertRaises(ValueError):
+            cache.incr("missing")
+        self.assertEqual(cache.get_many(["key", "counter", "missing"]), {"key": {"value": 1}, "counter": 6})
+        cache.delete("key")
+        self.assertIsNone(cache.get("key"))
+
+    def test_shared_between_instances(self):
+        self.make_cache().set("shared", "value")
+        self.assertEqual(self.make_cache().get("shared"), "value")
+
+    def test_lru_eviction(self):
+        cache = self.make_cache(MAX_ENTRIES=10)
+        cache.set("hot", 1)
+        for number in range(30):
+            cache.get("hot")
+            cache._connection().execute("UPDATE cache SET accessed = accessed + 100 WHERE key LIKE '%hot'")
+            cache.set(f"key-{number}", number)
+        self.assertEqual(cache.get("hot"), 1)
+        self.assertIsNone(cache.get("key-0"))
+        self.assertLessEqual(len(cache.get_many([f"key-{number}" for number in range(30)])), 10)
+
+    def test_tests_use_temporary_cache(self):
+        location = os.path.abspath(settings.CACHES["default"]["LOCATION"])
+        self.assertFalse(location.startswith(os.path.join(settings.BASE_DIR, "")))
+
+
+class PostCardCacheTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username=uuid.uuid4().hex)
+        self.reader = User.objects.create_user(username=uuid.uuid4().hex)
+        self.post = Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+        self.template = Template("{% load post_tags %}{% post_cards posts %}")
+
+    def render(self, user):
+        return self.template.render(Context({"posts": Post.objects.for_feed(), "user": user}))
+
+    def test_card_cached_until_post_changes(self):
+        self.assertIn(self.post.text, self.render(self.reader))
+        Post.objects.filter(pk=self.post.pk).update(text="changed behind the cache")
+        self.assertIn(self.post.text, self.render(self.reader))
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = uuid.uuid4().hex
+        post.save()
+        self.assertIn(post.text, self.render(self.reader))
+
+    def test_card_invalidated_by_comment(self):
+        self.assertIn("Добавить комментарий", self.render(self.reader))
+        Comment.objects.create(post=self.post, author=self.reader, text=uuid.uuid4().hex)
+        self.assertIn("1 комментариев", self.render(self.reader))
+
+    def test_card_depends_on_viewer_being_author(self):
+        edit_url = reverse("post_edit", args=[self.author.username, self.post.pk])
+        self.assertNotIn(edit_url, self.render(self.reader))
+        self.assertIn(edit_url, self.render(self.author))
+        self.assertNotIn(edit_url, self.render(AnonymousUser()))
+
+    def test_card_invalidated_by_group_and_author_rename(self):
+        group = Group.objects.create(title=uuid.uuid4().hex, slug=uuid.uuid4().hex,
+                                     description=uuid.uuid4().hex)
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        self.render(self.reader)
+        group.title = uuid.uuid4().hex
+        group.save()
+        self.assertIn(group.title, self.render(self.reader))
+        self.author.username = uuid.uuid4().hex
+        self.author.save()
+        self.assertIn(f"@{self.author.username}", self.render(self.reader))
+
+    def test_feed_pages_follow_author_rename(self):
+        group = Group.objects.create(title=uuid.uuid4().hex, slug=uuid.uuid4().hex,
+                                     description=uuid.uuid4().hex)
+        self.post.group = group
+        self.post.save()
+        urls = [reverse("index"), reverse("group", args=[group.slug]), reverse("api_posts")]
+        for url in urls:
+            self.assertContains(self.client.get(url), self.author.username)
+        old_username = self.author.username
+        self.author.username = uuid.uuid4().hex
+        self.author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, self.author.username)
+                self.assertNotContains(response, old_username)
+
+    def test_profile_page_follows_group_rename(self):
+        group = Group.objects.create(title=uuid.uuid4().hex, slug=uuid.uuid4().hex,
+                                     description=uuid.uuid4().hex)
+        self.post.group = group
+        self.post.save()
+        url = reverse("profile", args=[self.author.username])
+        self.assertContains(self.client.get(url), group.title)
+        old_title = group.title
+        group.title = uuid.uuid4().hex
+        group.save()
+        response = self.client.get(url)
+        self.assertContains(response, group.title)
+        self.assertNotContains(response, old_title)
+
+
+class ThumbnailTest(TempMediaMixin, CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=uuid.uuid4().hex)
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(text=uuid.uuid4().hex, author=self.user)
+        with open(os.path.join(TESTDATA, "1.png"), "rb") as img:
+            self.post.image.save(f"{uuid.uuid4().hex}.png", File(img))
+
+    def test_placeholder_while_pending(self):
+        with mock.patch.object(thumbnails, "schedule") as schedule:
+            response = self.client.get(reverse("post", args=[self.user.username, self.post.pk]))
+        schedule.assert_called_once_with(self.post.image.name)
+        self.assertContains(response, '<div class="card-img bg-light"')
+        self.assertNotContains(response, '<img class="card-img"')
+
+    def test_pregenerated_thumbnail(self):
+        call_command("generate_thumbnails", stdout=StringIO())
+        self.assertIsNotNone(thumbnails.lookup(self.post.image, "card"))
+        with mock.patch.object(thumbnails, "schedule") as schedule:
+            response = self.client.get(reverse("post", args=[self.user.username, self.post.pk]))
+        schedule.assert_not_called()
+        self.assertContains(response, '<img class="card-img" src="/media/cache/')
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_missing_source_not_retried(self):
+        os.remove(self.post.image.path)
+        version = Post.objects.get(pk=self.post.pk).version
+        self.assertIsNone(thumbnails.lookup(self.post.image, "card"))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).version, version)
+        with mock.patch.object(thumbnails, "schedule") as schedule:
+            self.assertIsNone(thumbnails.lookup(self.post.image, "card"))
+        schedule.assert_not_called()
+
+
+class UploadPipelineTest(TempMediaMixin, CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=uuid.uuid4().hex)
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(text=uuid.uuid4().hex, author=self.user)
+
+    def make_image(self, size, image_format="JPEG", **options):
+        buffer = BytesIO()
+        PILImage.new("RGB", size, "blue").save(buffer, image_format, **options)
+        buffer.seek(0)
+        buffer.name = f"{uuid.uuid4().hex}.{image_format.lower()}"
+        return buffer
+
+    def upload(self, image):
+        with override_settings(THUMBNAIL_WORKERS=0):
+            return self.client.post(reverse("post_edit", args=[self.user.username, self.post.pk]),
+                                    {"text": self.post.text, "image": image})
+
+    def stored_image(self):
+        post = Post.objects.get(pk=self.post.pk)
+        return PILImage.open(post.image.path)
+
+    @override_settings(UPLOAD_IMAGE_MAX_SIDE=500)
+    def test_downscale_and_strip_metadata(self):
+        exif = PILImage.Exif()
+        exif[0x010F] = "Camera"
+        self.upload(self.make_image((1500, 300), exif=exif.tobytes()))
+        with self.stored_image() as image:
+            self.assertEqual(image.size, (500, 100))
+            self.assertNotIn("exif", image.info)
+
+    @override_settings(UPLOAD_MAX_SIZE=100)
+    def test_oversized_upload_rejected(self):
+        response = self.upload(self.make_image((1000, 1000), "PNG"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["form"].errors["image"])
+        self.assertFalse(Post.objects.get(pk=self.post.pk).image)
+
+    @override_settings(UPLOAD_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        response = self.upload(self.make_image((20, 20)))
+        self.assertIn("image", response.context["form"].errors)
+
+    @override_settings(UPLOAD_IMAGE_WEBP=True)
+    def test_webp_output(self):
+        self.upload(self.make_image((100, 100)))
+        self.assertTrue(Post.objects.get(pk=self.post.pk).image.name.endswith(".webp"))
+        with self.stored_image() as image:
+            self.assertEqual(image.format, "WEBP")
+
+
+class SearchTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=uuid.uuid4().hex)
+
+    def search(self, query, cursor=None):
+        return search.SearchPaginator(query, per_page=2).get_page(cursor)
+
+    def test_ranking_and_comments(self):
+        weak = Post.objects.create(text="про котов и собак", author=self.user)
+        strong = Post.objects.create(text="коты коты коты", author=self.user)
+        commented = Post.objects.create(text="без ключевого слова", author=self.user)
+        Comment.objects.create(post=commented, author=self.user, text="а у меня коты")
+        Post.objects.create(text="совсем другое", author=self.user)
+        first = self.search("кот")
+        self.assertEqual(first.object_list[0], strong)
+        self.assertTrue(first.has_next())
+        second = self.search("кот", first.next_cursor)
+        found = first.object_list + second.object_list
+        self.assertCountEqual(found, [weak, strong, commented])
+        self.assertFalse(second.has_next())
+
+    def test_index_follows_edit_and_delete(self):
+        post = Post.objects.create(text="старый текст", author=self.user)
+        post.text = "новый текст"
+        post.save()
+        self.assertFalse(self.search("старый").object_list)
+        self.assertEqual(self.search("новый").object_list, [post])
+        post.delete()
+        self.assertFalse(self.search("новый").object_list)
+
+    def test_view_keeps_query_in_pagination(self):
+        for number in range(12):
+            Post.objects.create(text=f"поиск {number}", author=self.user)
+        response = self.client.get(reverse("search"), {"q": "поиск"})
+        self.assertEqual(len(response.context["page"]), 10)
+        self.assertContains(response, "?q=%D0%BF%D0%BE%D0%B8%D1%81%D0%BA&amp;cursor=")
+        response = self.client.get(reverse("search"), {"q": '"); DROP TABLE'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_tsquery_expression(self):
+        self.assertEqual(search.tsquery_expression("Кот & пёс:*"), "кот:* & пёс:*")
+        self.assertEqual(search.tsquery_expression("!&|"), "")
+
+    def test_unsupported_backend_fails_loudly(self):
+        with mock.patch.object(search, "enabled", return_value=False), \
+                self.assertRaises(NotSupportedError):
+            self.search("кот")
+
+
+class TransferTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.author = User.objects.create_user(username=uuid.uuid4().hex)
+        self.reader = User.objects.create_user(username=uuid.uuid4().hex)
+        self.group = Group.objects.create(title="Группа", slug=uuid.uuid4().hex, description="-")
+        self.post = Post.objects.create(text="перенос данных, строка\n\"вторая\"",
+                                        author=self.author, group=self.group)
+        Post.objects.filter(pk=self.post.pk).update(pub_date="2019-01-02T03:04:05Z")
+        Comment.objects.create(post=self.post, author=self.reader, text="комментарий")
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def round_trip(self, extension):
+        paths = {name: f"{self.directory}/{name}.{extension}"
+                 for name in ["group", "post", "comment", "follow"]}
+        for name, path in paths.items():
+            call_command("export_data", name, path, stderr=StringIO())
+        reader_name = self.reader.username
+        self.reader.delete()
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        for name, path in paths.items():
+            call_command("import_data", name, path, "--batch-size", "1", stdout=StringIO())
+        return User.objects.get(username=reader_name)
+
+    def check_imported(self, reader):
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, self.post.text)
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.pub_date.isoformat(), "2019-01-02T03:04:05+00:00")
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.comments.get().author, reader)
+        self.assertEqual(reader.stats.following_count, 1)
+        page = timeline.TimelinePaginator(reader, Post.objects.all()).page()
+        self.assertEqual(list(page), [post])
+        self.assertEqual(search.SearchPaginator("перенос").get_page().object_list, [post])
+
+    def test_jsonl_round_trip(self):
+        self.check_imported(self.round_trip("jsonl"))
+
+    def test_csv_round_trip(self):
+        self.check_imported(self.round_trip("csv"))
+
+    def test_import_skips_existing_rows(self):
+        path = f"{self.directory}/post.jsonl"
+        call_command("export_data", "post", path, stderr=StringIO())
+        call_command("import_data", "post", path, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 1)
+
+
+class BenchmarkCommandsTest(CacheIsolatedTestCase):
+    def test_generate_and_bench(self):
+        call_command("generate_data", "--users", "20", "--posts", "60", "--comments", "40",
+                     "--follows", "30", "--groups", "3", stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertEqual(Post.objects.filter(comments_count__gt=0).count(),
+                         Comment.objects.values("post").distinct().count())
+        # Степенной закон: у самого популярного автора больше постов, чем в среднем.
+        top = UserStats.objects.order_by("-posts_count").first()
+        self.assertGreater(top.posts_count, 60 / 20)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = f"{directory}/bench.json"
+        call_command("bench_views", "--requests", "2", "--output", output, stdout=StringIO())
+        with open(output) as stream:
+            report = json.load(stream)
+        self.assertEqual(report["posts"], 60)
+        self.assertIn("follow_index", report["views"])
+        self.assertGreater(report["views"]["index"]["p50_ms"], 0)
+
+
+class TrendingTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="trend")
+        self.group = Group.objects.create(title="Группа", slug="trend-group", description="о")
+        self.old = Post.objects.create(text="старый пост", author=self.user, group=self.group)
+        self.new = Post.objects.create(text="новый пост", author=self.user)
+
+    def comment(self, post, count=1):
+        for number in range(count):
+            Comment.objects.create(post=post, author=self.user, text=f"к {number}")
+
+    def test_logaddexp(self):
+        self.assertAlmostEqual(trending.logaddexp(1.0, 2.0), math.log(math.e + math.e ** 2))
+        self.assertEqual(trending.logaddexp(5000.0, 0.0), 5000.0)
+
+    def test_event_weight_doubles_every_half_life(self):
+        moment = timezone.now()
+        later = moment + timedelta(seconds=settings.TRENDING_HALF_LIFE)
+        self.assertAlmostEqual(trending.event_score(later) - trending.event_score(moment),
+                               math.log(2))
+
+    def test_comments_raise_post(self):
+        self.assertEqual(list(trending.top()), [self.new, self.old])
+        self.comment(self.old, 2)
+        self.assertEqual(list(trending.top()), [self.old, self.new])
+        self.assertEqual(list(trending.top(self.group)), [self.old])
+
+    def test_post_moved_between_groups(self):
+        self.new.group = self.group
+        self.new.save()
+        self.assertEqual(set(trending.top(self.group)), {self.old, self.new})
+
+    def test_rebuild_matches_incremental_scores(self):
+        self.comment(self.old, 3)
+        self.comment(self.new)
+        before = dict(TrendingScore.objects.values_list("post_id", "score"))
+        self.assertEqual(trending.rebuild(chunk_size=1), 2)
+        after = dict(TrendingScore.objects.values_list("post_id", "score"))
+        for post_id, score in before.items():
+            self.assertAlmostEqual(after[post_id], score)
+
+    def test_pages(self):
+        self.comment(self.old)
+        with self.assertQueryBudget(6):
+            response = self.client.get(reverse("trending"))
+        self.assertContains(response, "старый пост")
+        self.assertContains(response, "новый пост")
+        response = self.client.get(reverse("group_trending", args=[self.group.slug]))
+        self.assertContains(response, "старый пост")
+        self.assertNotContains(response, "новый пост")
+
+    def test_comment_invalidates_cached_page(self):
+        self.client.get(reverse("trending"))
+        self.comment(self.old, 2)
+        response = self.client.get(reverse("trending"))
+        self.assertLess(response.content.index("старый пост".encode()),
+                        response.content.index("новый пост".encode()))
+
+
+class AdminTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("moderator", "m@example.com", "pass")
+        self.client = Client()
+        self.client.force_login(self.admin)
+        group = Group.objects.create(title="Группа", slug="admin-group", description="о")
+        for number in range(5):
+            post = Post.objects.create(text=f"пост {number}", author=self.admin, group=group)
+            Comment.objects.create(post=post, author=self.admin, text=f"комментарий {number}")
+        Follow.objects.create(user=User.objects.create_user(username="reader"),
+                              author=self.admin)
+
+    def test_changelists_do_not_query_per_row(self):
+        for model in ("post", "comment", "follow"):
+            with self.subTest(model=model), self.assertQueryBudget(8, repeats=1):
+                response = self.client.get(reverse(f"admin:posts_{model}_changelist"))
+            self.assertEqual(response.status_code, 200)
+
+    def test_paginator_estimates_unfiltered_count(self):
+        paginator = admin.EstimatedCountPaginator(Post.objects.all(), 2)
+        with mock.patch.object(admin.EstimatedCountPaginator, "COUNT_LIMIT", 3):
+            self.assertEqual(paginator.count, Post.objects.order_by("-pk")[0].pk)
+            filtered = admin.EstimatedCountPaginator(Post.objects.filter(text__startswith="пост"), 2)
+            self.assertEqual(filtered.count, 3)
+
+    def test_export_csv_action(self):
+        posts = Post.objects.order_by("pk")[:2]
+        response = self.client.post(reverse("admin:posts_post_changelist"), {
+            "action": "export_post_csv",
+            "_selected_action": [post.pk for post in posts],
+        })
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,text,pub_date,author,group_id,image")
+        self.assertEqual(len(lines), 3)
+        self.assertIn("moderator", lines[1])
+
+
+class StreamingTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="streamer")
+        self.group = Group.objects.create(title="Поток", slug="stream", description="о")
+        for number in range(12):
+            Post.objects.create(text=f"потоковый пост {number}", author=self.user,
+                                group=self.group)
+
+    def get(self, url, **extra):
+        with override_settings(STREAM_FEEDS=True):
+            response = self.client.get(url, **extra)
+            chunks = list(response.streaming_content) if response.streaming else None
+        return response, chunks
+
+    def test_streamed_page_equals_rendered_page(self):
+        for url in (reverse("index"), reverse("group", args=["stream"]),
+                    reverse("profile", args=["streamer"])):
+            with self.subTest(url=url):
+                response, chunks = self.get(url)
+                self.assertTrue(response.streaming)
+                cache.clear()
+                self.assertEqual(b"".join(chunks).decode(),
+                                 self.client.get(url).content.decode())
+                cache.clear()
+
+    def test_head_sent_before_posts(self):
+        _, chunks = self.get(reverse("index"))
+        self.assertIn("<title>".encode(), chunks[0])
+        self.assertNotIn("потоковый пост".encode(), chunks[0])
+        # Шапка, карточки страницы и хвост с пагинацией.
+        self.assertEqual(len(chunks), 1 + 10 + 1)
+        self.assertIn(b"cursor=", chunks[-1])
+
+    def test_streamed_page_is_cached(self):
+        self.get(reverse("index"))
+        response, _ = self.get(reverse("index"))
+        self.assertFalse(response.streaming)
+        self.assertContains(response, "потоковый пост 11")
+
+    def test_stream_matches_page_cursors(self):
+        paginator = CursorPaginator(Post.objects.all())
+        page = paginator.page()
+        items, streamed = paginator.stream()
+        self.assertEqual(list(items), page.object_list)
+        self.assertEqual(streamed.next_cursor, page.next_cursor)
+        second = paginator.page(page.next_cursor)
+        items, streamed = paginator.stream(page.next_cursor)
+        self.assertEqual(list(items), second.object_list)
+        self.assertEqual(streamed.previous_cursor, second.previous_cursor)
+        self.assertIsNone(streamed.next_cursor)
+
+    def test_follow_index_streamed(self):
+        reader = User.objects.create_user(username="reader")
+        Follow.objects.create(user=reader, author=self.user)
+        self.client.force_login(reader)
+        response, chunks = self.get(reverse("follow_index"))
+        self.assertIn("потоковый пост 11".encode(), b"".join(chunks))
+
+    def test_gzip_chunks_flushed(self):
+        response, chunks = self.get(reverse("index"), HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertTrue(response["ETag"].startswith("W/"))
+        self.assertIn("Accept-Encoding", response["Vary"])
+        # Первый кусок распаковывается сам по себе: шапка не ждёт остальной страницы.
+        head = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(chunks[0])
+        self.assertIn("<title>".encode(), head)
+        cache.clear()
+        self.assertEqual(gzip.decompress(b"".join(chunks)),
+                         self.client.get(reverse("index")).content)
+
+
+class StaticFilesTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        source = f"{self.directory}/assets"
+        self.media = f"{self.directory}/media"
+        os.makedirs(f"{source}/css")
+        os.makedirs(self.media)
+        self.css = b"body { color: red; }\n" * 200
+        with open(f"{source}/css/site.css", "wb") as stream:
+            stream.write(self.css)
+        with open(f"{self.media}/photo.txt", "wb") as stream:
+            stream.write(b"photo")
+        settings_override = override_settings(
+            STATICFILES_DIRS=[source], STATIC_ROOT=f"{self.directory}/static",
+            STATICFILES_STORAGE="yatube.staticfiles.CompressedManifestStaticFilesStorage",
+            MEDIA_ROOT=self.media, SERVE_FILES=True,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+        self.server = staticfiles.wrap(self.django)
+
+    def django(self, environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b"django"]
+
+    def get(self, path, method="GET", **headers):
+        environ = {"REQUEST_METHOD": method, "PATH_INFO": path, **headers}
+        setup_testing_defaults(environ)
+        started = {}
+
+        def start_response(status, response_headers):
+            started["status"] = status
+            started["headers"] = dict(response_headers)
+
+        body = b"".join(self.server(environ, start_response))
+        return started["status"], started["headers"], body
+
+    def test_hashed_and_compressed_files(self):
+        url = Template("{% load static %}{% static 'css/site.css' %}").render(Context())
+        self.assertRegex(url, r"^/static/css/site\.[0-9a-f]{12}\.css$")
+        status, headers, body = self.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertIn("immutable", headers["Cache-Control"])
+        self.assertEqual(headers["Vary"], "Accept-Encoding")
+        self.assertEqual(gzip.decompress(body), self.css)
+
+        status, headers, body = self.get(url)
+        self.assertNotIn("Content-Encoding", headers)
+        self.assertEqual(body, self.css)
+        status, _, body = self.get(url, HTTP_IF_NONE_MATCH=headers["ETag"])
+        self.assertEqual(status, "304 Not Modified")
+        self.assertEqual(body, b"")
+
+    def test_unhashed_name_is_not_immutable(self):
+        status, headers, _ = self.get("/static/css/site.css")
+        self.assertEqual(status, "200 OK")
+        self.assertNotIn("immutable", headers["Cache-Control"])
+
+    def test_media(self):
+        status, headers, body = self.get("/media/photo.txt")
+        self.assertEqual(body, b"photo")
+        self.assertEqual(headers["Content-Length"], "5")
+        self.assertEqual(self.get("/media/../static/css/site.css")[2], b"django")
+        self.assertEqual(self.get("/media/nothing.txt")[2], b"django")
+
+    def test_other_requests_reach_django(self):
+        self.assertEqual(self.get("/")[2], b"django")
+        self.assertEqual(self.get("/media/photo.txt", method="POST")[2], b"django")
+
+
+class DatabaseSettingsTest(CacheIsolatedTestCase):
+    def test_sqlite_pragmas_applied_on_connect(self):
+        self.addCleanup(connection.connection.execute, "PRAGMA cache_size = -2000")
+        with override_settings(SQLITE_PRAGMAS={"cache_size": -4000}):
+            db.configure_sqlite(sender=None, connection=connection)
+        self.assertEqual(connection.connection.execute("PRAGMA cache_size").fetchone()[0],
+                         -4000)
+
+    def test_health_check_closes_broken_connection(self):
+        broken = mock.Mock(settings_dict={"CONN_HEALTH_CHECKS": True})
+        broken.is_usable.return_value = False
+        unchecked = mock.Mock(settings_dict={})
+        with mock.patch.object(db.connections, "all", return_value=[broken, unchecked]):
+            db.check_connections()
+        broken.close.assert_called_once_with()
+        unchecked.close.assert_not_called()
+
+
+class ProductionSettingsTest(CacheIsolatedTestCase):
+    def load(self, **environ):
+        sys.modules.pop("yatube.settings_production", None)
+        self.addCleanup(sys.modules.pop, "yatube.settings_production", None)
+        with mock.patch.dict(os.environ, environ):
+            for name in ("DJANGO_SECRET_KEY", "DJANGO_ALLOWED_HOSTS"):
+                if name not in environ:
+                    os.environ.pop(name, None)
+            return importlib.import_module("yatube.settings_production")
+
+    def test_secret_key_and_hosts_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.load(DJANGO_ALLOWED_HOSTS="example.com")
+        with self.assertRaises(ImproperlyConfigured):
+            self.load(DJANGO_SECRET_KEY=uuid.uuid4().hex)
+
+    def test_values_from_environment(self):
+        key = uuid.uuid4().hex
+        production = self.load(DJANGO_SECRET_KEY=key, DJANGO_ALLOWED_HOSTS="a.com,b.com")
+        self.assertEqual(production.SECRET_KEY, key)
+        self.assertEqual(production.ALLOWED_HOSTS, ["a.com", "b.com"])
+
+
+class AsgiTest(TransactionTestCase):
+    """Запросы выполняются в потоках пула, им нужны закоммиченные данные."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="asgi")
+        Post.objects.create(text="пост через asgi", author=self.user)
+
+    def request(self, path, method="GET", body=b"", headers=()):
+        scope = {"type": "http", "method": method, "path": path, "query_string": b"",
+                 "headers": [(b"host", b"testserver"), *headers],
+                 "client": ("192.0.2.1", 5000), "server": ("testserver", 80)}
+        chunks = [body[:3], body[3:]]
+        sent = []
+
+        async def receive():
+            chunk = chunks.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(asgi.application(scope, receive, send))
+        return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:])
+
+    def test_feed_through_asgi(self):
+        status, body = self.request(reverse("index"))
+        self.assertEqual(status, 200)
+        self.assertIn("пост через asgi".encode(), body)
+        status, _ = self.request("/нет-такого/страницы/")
+        self.assertEqual(status, 404)
+
+    def test_request_body(self):
+        status, _ = self.request(
+            reverse("login"), method="POST", body=b"username=asgi&password=x",
+            headers=[(b"content-type", b"application/x-www-form-urlencoded")])
+        # Без CSRF-токена форма отклоняется, но тело дошло до Django.
+        self.assertEqual(status, 403)
+
+    def test_environ_headers(self):
+        environ = asgi.build_environ({
+            "type": "http", "method": "GET", "path": "/профиль/", "query_string": b"a=1",
+            "headers": [(b"accept", b"text/html"), (b"accept", b"*/*"),
+                        (b"content-type", b"text/plain")],
+        }, BytesIO())
+        self.assertEqual(environ["HTTP_ACCEPT"], "text/html,*/*")
+        self.assertEqual(environ["CONTENT_TYPE"], "text/plain")
+        self.assertEqual(environ["PATH_INFO"].encode("latin-1").decode(), "/профиль/")
+
+    @override_settings(FEED_CONCURRENCY=True)
+    def test_profile_gathered_concurrently(self):
+        self.assertEqual(concurrency.gather(lambda: 1, lambda: 2, lambda: 3), [1, 2, 3])
+        response = Client().get(reverse("profile", args=[self.user.username]))
+        self.assertContains(response, "пост через asgi")
+        self.assertEqual(response.context["stats"].posts_count, 1)
+
+    def test_bench_asgi(self):
+        out = StringIO()
+        call_command("bench_asgi", "--requests", "4", "--concurrency", "2",
+                     "--host", "testserver", stdout=out)
+        self.assertIn("asgi+gather", out.getvalue())
+
+
+class DatabaseBenchmarkTest(TransactionTestCase):
+    """Копия базы делается через backup API, а он ждёт конца транзакции теста."""
+
+    def test_bench_db(self):
+        Post.objects.create(text="текст", author=User.objects.create_user(username="bench"))
+        out = StringIO()
+        call_command("bench_db", "--readers", "1", "--writers", "1", "--seconds", "0.2",
+                     stdout=out)
+        self.assertIn("wal+persistent", out.getvalue())
+
+
+@override_settings(METRICS_SAMPLE_RATE=1)
+class MetricsTest(CacheIsolatedTestCase):
+    def setUp(self):
+        metrics.reset()
+        self.client = Client()
+        self.user = User.objects.create_user(username=uuid.uuid4().hex)
+        self.post = Post.objects.create(text=uuid.uuid4().hex, author=self.user)
+
+    def test_sampled_request_recorded(self):
+        self.client.get(reverse("index"))
+        self.client.get(reverse("index"))
+        view = metrics.snapshot()["index"]
+        self.assertEqual(view["requests"], 2)
+        self.assertEqual(view["sampled"], 2)
+        self.assertGreater(view["queries"], 0)
+        self.assertGreater(view["template_seconds"], 0)
+        # Вторая страница целиком берётся из кэша.
+        self.assertGreater(view["cache_hits"], 0)
+        self.assertGreater(view["cache_misses"], 0)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_request_only_timed(self):
+        self.client.get(reverse("index"))
+        view = metrics.snapshot()["index"]
+        self.assertEqual((view["requests"], view["sampled"], view["queries"]), (1, 0, 0))
+
+    @override_settings(METRICS_QUERY_THRESHOLDS={"post": 1})
+    def test_query_threshold_warning(self):
+        with self.assertLogs("yatube.metrics", "WARNING") as logs:
+            self.client.get(reverse("post", args=[self.user.username, self.post.pk]))
+        self.assertIn('"view": "post"', logs.output[0])
+        self.assertEqual(metrics.snapshot()["post"]["over_threshold"], 1)
+
+    def test_prometheus_endpoint(self):
+        self.client.get(reverse("index"))
+        response = self.client.get(reverse("metrics"))
+        self.assertContains(response, 'yatube_requests_total{view="index"')
+        self.assertContains(response, "# TYPE yatube_request_seconds histogram")
+        self.assertEqual(Client(REMOTE_ADDR="192.0.2.1").get(reverse("metrics")).status_code, 404)
+
+
+class QueryCheckTest(CacheIsolatedTestCase):
+    def setUp(self):
+        author = User.objects.create_user(username=uuid.uuid4().hex)
+        self.post = Post.objects.create(text=uuid.uuid4().hex, author=author)
+        for _ in range(3):
+            Comment.objects.create(post=self.post, text=uuid.uuid4().hex,
+                                   author=User.objects.create_user(username=uuid.uuid4().hex))
+
+    def test_repeated_queries_point_to_template(self):
+        template = Template("{% for item in comments %}\n{{ item.author.username }}{% endfor %}")
+        with capture() as log:
+            template.render(Context({"comments": self.post.comments.all()}))
+        [(shape, total, origins)] = log.repeated(3)
+        self.assertEqual(total, 3)
+        self.assertIn('"auth_user"', shape)
+        self.assertEqual(list(origins), ["<шаблон>:2 item.author.username"])
+
+    def test_repeated_queries_point_to_code(self):
+        with capture() as log:
+            [comment.author.username for comment in self.post.comments.all()]
+        [(_, total, origins)] = log.repeated(3)
+        place, = origins
+        self.assertTrue(place.startswith("posts/tests.py:"), place)
+
+    def test_budget_failure_lists_repeats(self):
+        with self.assertRaises(AssertionError) as failure:
+            with self.assertQueryBudget(2):
+                [comment.author.username for comment in self.post.comments.all()]
+        self.assertIn("4 SQL-запросов при бюджете 2", str(failure.exception))
+        self.assertIn("3× SELECT", str(failure.exception))
+
+
+class CommentPaginationTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=uuid.uuid4().hex)
+        self.post = Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+        self.url = reverse("post", args=[self.author.username, self.post.pk])
+
+    def comment(self, number):
+        return Comment.objects.create(post=self.post, text=f"comment-{number:03}",
+                                      author=User.objects.create_user(username=uuid.uuid4().hex))
+
+    def test_first_page_and_fragment(self):
+        for number in range(25):
+            self.comment(number)
+        response = self.client.get(self.url)
+        page = response.context["comments"]
+        self.assertEqual([item.text for item in page][:2], ["comment-000", "comment-001"])
+        self.assertEqual(len(page), 20)
+        self.assertNotContains(response, "comment-020")
+        fragment_url = reverse("post_comments", args=[self.author.username, self.post.pk])
+        self.assertContains(response, f"{fragment_url}?comments={page.next_cursor}")
+
+        fragment = self.client.get(fragment_url, {"comments": page.next_cursor})
+        self.assertContains(fragment, "comment-020")
+        self.assertContains(fragment, "comment-024")
+        self.assertNotContains(fragment, "comment-019")
+        self.assertNotContains(fragment, "<html")
+        self.assertNotContains(fragment, "Показать ещё")
+
+    def test_post_view_cost_does_not_grow_with_comments(self):
+        self.comment(0)
+        with self.assertQueryBudget(100) as log:
+            self.client.get(self.url)
+        single = len(log)
+        for number in range(1, 30):
+            self.comment(number)
+        with self.assertQueryBudget(single, repeats=1):
+            self.client.get(self.url)
+
+
+class AddCommentTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=uuid.uuid4().hex)
+        self.reader = User.objects.create_user(username=uuid.uuid4().hex)
+        self.post = Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+        self.url = reverse("add_comment", args=[self.author.username, self.post.pk])
+        self.client.force_login(self.reader)
+
+    def test_get_redirects_to_post(self):
+        response = self.client.get(self.url)
+        self.assertRedirects(response, reverse("post", args=[self.author.username, self.post.pk]),
+                             status_code=301)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_username_must_match_author(self):
+        wrong = [self.reader.username, self.post.pk]
+        self.assertEqual(self.client.get(reverse("post", args=wrong)).status_code, 404)
+        self.assertEqual(self.client.post(reverse("add_comment", args=wrong),
+                                          {"text": "текст"}).status_code, 404)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_ajax_comment_returns_fragment(self):
+        text = uuid.uuid4().hex
+        response = self.client.post(self.url, {"text": text},
+                                    HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data["comments_count"], 1)
+        self.assertIn(text, data["html"])
+        self.assertNotIn("<html", data["html"])
+        self.assertEqual(Comment.objects.get().pk, data["id"])
+
+    def test_invalid_comment(self):
+        response = self.client.post(self.url, {"text": ""}, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("text", response.json()["errors"])
+        response = self.client.post(self.url, {"text": ""})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.context["form"].errors)
+
+
+class ConditionalGetTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=uuid.uuid4().hex)
+        self.reader = User.objects.create_user(username=uuid.uuid4().hex)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post = Post.objects.create(text=uuid.uuid4().hex, author=self.author)
+        self.client.force_login(self.reader)
+
+    def assertRevalidates(self, url, change, queries=2):
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertIn("Cookie", response["Vary"])
+        # Сессия, пользователь и, кроме лент с поколениями, лёгкий запрос
+        # для ETag; ни ленты, ни шаблонов.
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def edit_post(self):
+        self.post.text = uuid.uuid4().hex
+        self.post.save()
+
+    def add_comment(self):
+        Comment.objects.create(post=self.post, author=self.reader, text=uuid.uuid4().hex)
+
+    def test_index(self):
+        self.assertRevalidates(reverse("index"), self.edit_post)
+
+    def test_profile(self):
+        self.assertRevalidates(reverse("profile", args=[self.author.username]), self.edit_post)
+
+    def test_post_view(self):
+        self.assertRevalidates(reverse("post", args=[self.author.username, self.post.pk]),
+                               self.add_comment, queries=3)
+
+    def test_post_etag_does_not_start_generation(self):
+        request = RequestFactory().get("/")
+        request.user = self.reader
+        name = f"profile:{self.author.username}"
+        self.assertIsNone(views.post_etag(request, self.author.username, self.post.pk))
+        self.assertIsNone(caching.generation(name))
+        self.client.get(reverse("post", args=[self.author.username, self.post.pk]))
+        self.assertIsNotNone(caching.generation(name))
+
+    def test_follow_index(self):
+        # Сессия, пользователь, «звёзды» среди подписок и записи ленты.
+        self.assertRevalidates(reverse("follow_index"), self.edit_post, queries=4)
+
+    def test_etag_is_per_user(self):
+        url = reverse("index")
+        etag = self.client.get(url)["ETag"]
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ApiTest(CacheIsolatedTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=uuid.uuid4().hex)
+        self.reader = User.objects.create_user(username=uuid.uuid4().hex)
+        self.group = Group.objects.create(title="Группа", slug=uuid.uuid4().hex, description="-")
+        self.posts = [Post.objects.create(text=f"post {number}", author=self.author, group=self.group)
+                      for number in range(12)]
+        Comment.objects.create(post=self.posts[0], author=self.reader, text="комментарий")
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_posts_pages_and_fields(self):
+        with self.assertQueryBudget(1):
+            data = self.client.get(reverse("api_posts"), {"fields": "id,author,group"}).json()
+        self.assertEqual(len(data["results"]), 10)
+        self.assertEqual(data["results"][0], {"id": self.posts[-1].pk, "author": self.author.username,
+                                              "group": self.group.slug})
+        self.assertIsNone(data["previous"])
+        rest = self.client.get(data["next"]).json()
+        self.assertEqual([item["id"] for item in rest["results"]],
+                         [self.posts[1].pk, self.posts[0].pk])
+        self.assertEqual(set(rest["results"][0]), {"id", "author", "group"})
+        self.assertIsNone(rest["next"])
+
+    def test_unknown_field_and_missing_object(self):
+        response = self.client.get(reverse("api_posts"), {"fields": "id,password"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("password", response.json()["detail"])
+        response = self.client.get(reverse("api_post", args=[10 ** 6]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_detail_comments_and_profile(self):
+        post = self.client.get(reverse("api_post", args=[self.posts[0].pk])).json()
+        self.assertEqual(post["comments_count"], 1)
+        self.assertIsNone(post["image"])
+        comments = self.client.get(reverse("api_post_comments", args=[self.posts[0].pk])).json()
+        self.assertEqual(comments["results"][0]["author"], self.reader.username)
+        profile = self.client.get(reverse("api_user", args=[self.author.username])).json()
+        self.assertEqual((profile["posts_count"], profile["followers_count"]), (12, 1))
+        followers = self.client.get(reverse("api_user_followers", args=[self.author.username])).json()
+        self.assertEqual(followers["results"][0]["user"], self.reader.username)
+
+    def test_feeds_share_page_cache(self):
+        url = reverse("api_group_posts", args=[self.group.slug])
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, first.content)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        Post.objects.create(text="новый", author=self.author, group=self.group)
+        self.assertEqual(self.client.get(url).json()["results"][0]["text"], "новый")
+
+    def test_follow_feed(self):
+        self.assertEqual(self.client.get(reverse("api_follow")).status_code, 401)
+        self.client.force_login(self.reader)
+        data = self.client.get(reverse("api_follow"), {"limit": 3}).json()
+        self.assertEqual([item["id"] for item in data["results"]],
+                         [post.pk for post in self.posts[:-4:-1]])
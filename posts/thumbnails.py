@@ -0,0 +1,133 @@
+"""Миниатюры картинок постов, которые готовятся заранее и в фоне.
+
+Миниатюры всех размеров из SIZES строятся при загрузке картинки в пуле
+потоков, а шаблон только ищет готовую миниатюру в хранилище sorl и, если
+её ещё нет, показывает заглушку, а не ждёт Pillow.
+
+Если миниатюру построить не удалось (нет исходника, битый файл), это
+запоминается в кэше на RETRY_AFTER секунд, чтобы каждый показ поста не
+ставил её в очередь заново.
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import F
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts import caching
+from posts.models import Post
+
+logger = logging.getLogger(__name__)
+
+SIZES = {
+    "card": ("960x339", {"crop": "center", "upscale": True}),
+}
+
+RETRY_AFTER = getattr(settings, "THUMBNAIL_RETRY_AFTER", 60 * 60)
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+class LookupBackend(ThumbnailBackend):
+    def lookup(self, file_, geometry_string, **options):
+        """Готовая миниатюра из хранилища sorl или None; ничего не генерирует."""
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault("format", self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = LookupBackend()
+
+
+def workers():
+    return getattr(settings, "THUMBNAIL_WORKERS", 2)
+
+
+def failure_key(name):
+    return f"thumbnail-failed:{hashlib.md5(name.encode()).hexdigest()}"
+
+
+def stored(name):
+    return all(backend.lookup(name, geometry, **options) is not None
+               for geometry, options in SIZES.values())
+
+
+def generate(name):
+    for geometry, options in SIZES.values():
+        get_thumbnail(name, geometry, **options)
+    # sorl не бросает исключение, если исходника нет: он отдаёт миниатюру,
+    # не сохранив её. Перерисовывать страницы тогда незачем.
+    if not stored(name):
+        logger.warning("Миниатюры для %s не построены", name)
+        cache.set(failure_key(name), True, RETRY_AFTER)
+        return
+    # Карточки и страницы лент с заглушкой нужно перерисовать.
+    Post.objects.filter(image=name).update(version=F("version") + 1)
+    for post in Post.objects.filter(image=name).select_related("author", "group"):
+        caching.bump(*caching.feeds_for_post(post))
+
+
+def _run(name):
+    close_old_connections()
+    try:
+        generate(name)
+    except Exception:
+        logger.exception("Не удалось построить миниатюры для %s", name)
+        cache.set(failure_key(name), True, RETRY_AFTER)
+    finally:
+        with _lock:
+            _pending.pop(name, None)
+        close_old_connections()
+
+
+def schedule(name):
+    global _executor
+    if not name:
+        return
+    if not workers():
+        generate(name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers(),
+                                           thread_name_prefix="thumbnails")
+        _pending[name] = _executor.submit(_run, name)
+
+
+def lookup(image, size):
+    """Готовая миниатюра или None; отсутствующую ставит в очередь,
+    если недавно её уже не пытались построить без успеха."""
+    if not image:
+        return None
+    geometry, options = SIZES[size]
+    thumbnail = backend.lookup(image, geometry, **options)
+    if thumbnail is None and not cache.get(failure_key(image.name)):
+        schedule(image.name)
+    return thumbnail
+
+
+def wait():
+    with _lock:
+        futures = list(_pending.values())
+    wait_futures(futures)
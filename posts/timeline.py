@@ -0,0 +1,229 @@
+"""Материализованная лента подписок.
+
+Новый пост раскладывается в ленты подписчиков автора (fan-out on write).
+Посты авторов с очень большим числом подписчиков в ленты не пишутся,
+а подмешиваются при чтении (fan-out on read).
+
+Страница ленты читается по индексу (user, pub_date, post) записей и
+сливается с несколькими последними постами каждой «звезды», поэтому её
+стоимость не зависит от длины ленты и числа постов у авторов.
+"""
+import functools
+import heapq
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+
+from posts.models import Follow, Post, TimelineEntry, UserStats
+from posts.paginator import PER_PAGE, CursorPaginator
+
+FANOUT_LIMIT = getattr(settings, "TIMELINE_FANOUT_LIMIT", 1000)
+BACKFILL = getattr(settings, "TIMELINE_BACKFILL", 100)
+SIZE = getattr(settings, "TIMELINE_SIZE", 1000)
+# Ленту подписчика обрезаем до SIZE, когда она переросла его на TRIM_EVERY
+# записей: так обрезка идёт примерно раз в TRIM_EVERY постов в ленте.
+TRIM_EVERY = getattr(settings, "TIMELINE_TRIM_EVERY", 100)
+BATCH_SIZE = 500
+
+
+def is_celebrity(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id, followers_count__gte=FANOUT_LIMIT
+    ).exists()
+
+
+def _store(entries):
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def fan_out(post):
+    if post.author_id is None or is_celebrity(post.author_id):
+        return
+    followers = (Follow.objects.filter(author_id=post.author_id)
+                 .values_list("user_id", flat=True))
+    batch = []
+    for user_id in followers.iterator():
+        batch.append(TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date))
+        if len(batch) >= BATCH_SIZE:
+            _store(batch)
+            batch = []
+    _store(batch)
+    overgrown = list(TimelineEntry.objects.filter(user_id__in=followers)
+                     .values("user_id").annotate(entries=Count("id"))
+                     .filter(entries__gt=SIZE + TRIM_EVERY)
+                     .values_list("user_id", flat=True))
+    if overgrown:
+        trim(overgrown)
+
+
+def recent_posts(author_id):
+    return list(Post.objects.filter(author_id=author_id).order_by("-pub_date", "-id")
+                .values_list("pk", "pub_date")[:BACKFILL])
+
+
+def backfill(user, author):
+    if is_celebrity(author.pk):
+        return
+    _store([TimelineEntry(user=user, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in recent_posts(author.pk)])
+    trim([user.pk])
+
+
+def backfill_followers(author_id):
+    """Раскладывает последние посты автора по лентам всех его подписчиков.
+
+    Нужно, когда автор перестаёт быть «звездой»: посты, написанные за это
+    время, по лентам не раскладывались.
+    """
+    posts = recent_posts(author_id)
+    followers = (Follow.objects.filter(author_id=author_id)
+                 .values_list("user_id", flat=True))
+    batch = []
+    for user_id in followers.iterator():
+        batch.extend(TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+                     for post_id, pub_date in posts)
+        if len(batch) >= BATCH_SIZE:
+            _store(batch)
+            batch = []
+    _store(batch)
+    trim(followers)
+
+
+def follower_lost(author_id):
+    """Вызывается после уменьшения счётчика подписчиков автора."""
+    crossed = UserStats.objects.filter(
+        user_id=author_id, followers_count=FANOUT_LIMIT - 1
+    ).exists()
+    if crossed:
+        backfill_followers(author_id)
+
+
+def prune(user, author):
+    """user и author — пользователи или их id."""
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def trim(user_ids=None):
+    """Оставляет в лентах пользователей не больше SIZE последних записей.
+
+    user_ids — список или запрос id; None — все ленты.
+    """
+    entries = TimelineEntry.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+    sql, params = entries.values("id", "user_id", "pub_date", "post_id").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM posts_timelineentry WHERE id IN ("
+            "  SELECT id FROM (SELECT id, ROW_NUMBER() OVER ("
+            "    PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC) AS position "
+            f"   FROM ({sql}) entries) ranked "
+            "  WHERE position > %s)",
+            [*params, SIZE]
+        )
+        return cursor.rowcount
+
+
+@transaction.atomic
+def rebuild():
+    """Заново раскладывает последние посты авторов по лентам подписчиков.
+
+    Всё делается одним INSERT ... SELECT: на больших графах создание
+    объектов TimelineEntry в Python в десятки раз медленнее.
+    """
+    TimelineEntry.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO posts_timelineentry (user_id, post_id, pub_date) "
+            "SELECT f.user_id, recent.id, recent.pub_date FROM posts_follow f "
+            "JOIN (SELECT id, author_id, pub_date, ROW_NUMBER() OVER ("
+            "      PARTITION BY author_id ORDER BY pub_date DESC, id DESC) AS position "
+            "      FROM posts_post) recent "
+            "  ON recent.author_id = f.author_id AND recent.position <= %s "
+            "LEFT JOIN posts_userstats s ON s.user_id = f.author_id "
+            "WHERE f.user_id IS NOT NULL AND COALESCE(s.followers_count, 0) < %s",
+            [BACKFILL, FANOUT_LIMIT]
+        )
+        created = cursor.rowcount
+    trim()
+    return created
+
+
+def celebrity_ids(user):
+    """Id «звёзд», на которых подписан пользователь; запоминается на объекте
+    пользователя, чтобы ETag и сама страница не спрашивали базу дважды."""
+    if not hasattr(user, "_timeline_celebrities"):
+        user._timeline_celebrities = list(
+            Follow.objects.filter(user=user,
+                                  author__stats__followers_count__gte=FANOUT_LIMIT)
+            .order_by().values_list("author_id", flat=True)
+        )
+    return user._timeline_celebrities
+
+
+class TimelinePaginator(CursorPaginator):
+    """Курсорные страницы ленты подписок.
+
+    queryset — запрос постов (объекты или .values() с id и pub_date):
+    из него берутся поля и select_related, а строки выбираются по индексу
+    записей ленты и по индексу (author, pub_date) постов «звёзд».
+    Порядок всегда (-pub_date, -id), ordering принимается ради paginate().
+    """
+
+    def __init__(self, user, queryset, per_page=PER_PAGE, ordering=None):
+        super().__init__(queryset, per_page)
+        self.user = user
+
+    def _bounded(self, condition, date_field, pk_field, values, reverse):
+        """Не больше per_page + 1 строк за курсором по индексу (…, date, pk).
+
+        Все условия передаются одним filter(): иначе для записей ленты
+        Django добавил бы второй JOIN и индекс перестал бы задавать порядок.
+        """
+        # F(), а не строки: иначе сортировка по внешнему ключу поста
+        # разворачивается в Post.Meta.ordering и лишний JOIN.
+        ordering = [F(name).asc() if reverse else F(name).desc()
+                    for name in (date_field, pk_field)]
+        if values is not None:
+            lookup = "gt" if reverse else "lt"
+            date, pk = values
+            # Первое условие — граница диапазона индекса, второе уточняет её.
+            condition &= Q(**{f"{date_field}__{lookup}e": date}) & (
+                Q(**{f"{date_field}__{lookup}": date})
+                | Q(**{date_field: date, f"{pk_field}__{lookup}": pk})
+            )
+        queryset = self.queryset.filter(condition).order_by(*ordering)
+        return list(queryset[:self.per_page + 1])
+
+    def _slice(self, values, reverse):
+        sources = [self._bounded(Q(timeline_entries__user=self.user),
+                                 "timeline_entries__pub_date", "timeline_entries__post",
+                                 values, reverse)]
+        sources += [self._bounded(Q(author_id=author_id), "pub_date", "id", values, reverse)
+                    for author_id in celebrity_ids(self.user)]
+        items, seen = [], set()
+        for item in heapq.merge(*sources, key=self._key, reverse=not reverse):
+            pk = self._key(item)[1]
+            # Пост «звезды» мог попасть в ленты, пока у неё было мало подписчиков.
+            if pk in seen:
+                continue
+            seen.add(pk)
+            items.append(item)
+            if len(items) > self.per_page:
+                break
+        return items
+
+    def _iterate(self, values):
+        return iter(self._slice(values, False))
+
+    @staticmethod
+    def _key(item):
+        if isinstance(item, dict):
+            return item["pub_date"], item["id"]
+        return item.pub_date, item.pk
+
+
+def paginator(user):
+    """Фабрика для paginate() и page_response(): страницы ленты user."""
+    return functools.partial(TimelinePaginator, user)
@@ -0,0 +1,196 @@
+"""Потоковый импорт и экспорт данных в JSONL и CSV.
+
+Экспорт читает таблицу кусками через iterator(), импорт накапливает
+строки пачками и пишет их bulk_create, каждую пачку в своей транзакции,
+поэтому память не зависит от размера файла. Пользователи в файлах
+указываются по username и при импорте создаются, если их ещё нет.
+bulk_create не вызывает сигналы, поэтому после импорта нужно пересчитать
+счётчики, ленты и поисковый индекс (см. rebuild()).
+"""
+import csv
+import json
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import counters, search, timeline, trending
+from posts.models import Comment, Follow, Group, Post
+
+BATCH_SIZE = 1000
+# Сколько соответствий username -> id держать в памяти во время импорта.
+USER_CACHE_LIMIT = 100000
+
+
+class Spec:
+    def __init__(self, model, columns, lookups=None, users=(), dates=(), numbers=()):
+        self.model = model
+        self.columns = columns
+        self.lookups = [(lookups or {}).get(column, column) for column in columns]
+        self.users = users
+        self.dates = dates
+        self.numbers = numbers
+
+    def build(self, row, user_ids):
+        values = {}
+        for column in self.columns:
+            value = row.get(column)
+            if value == "":
+                value = None
+            if column in self.users:
+                values[f"{column}_id"] = user_ids[value] if value else None
+            elif column in self.dates:
+                values[column] = parse_datetime(value) if value else timezone.now()
+            elif column in self.numbers:
+                values[column] = int(value) if value is not None else None
+            else:
+                values[column] = value if value is not None else ""
+        return self.model(**values)
+
+
+SPECS = {
+    "group": Spec(Group, ["id", "title", "slug", "description"], numbers=("id",)),
+    "post": Spec(Post, ["id", "text", "pub_date", "author", "group_id", "image"],
+                 lookups={"author": "author__username"},
+                 users=("author",), dates=("pub_date",), numbers=("id", "group_id")),
+    "comment": Spec(Comment, ["id", "post_id", "author", "text", "created"],
+                    lookups={"author": "author__username"},
+                    users=("author",), dates=("created",), numbers=("id", "post_id")),
+    "follow": Spec(Follow, ["user", "author"],
+                   lookups={"user": "user__username", "author": "author__username"},
+                   users=("user", "author")),
+}
+
+
+def format_for(path, default="jsonl"):
+    return "csv" if path.endswith(".csv") else default
+
+
+def export_rows(name, chunk_size=BATCH_SIZE, queryset=None):
+    spec = SPECS[name]
+    if queryset is None:
+        queryset = spec.model.objects.all()
+    rows = (queryset.order_by("pk")
+            .values_list(*spec.lookups).iterator(chunk_size=chunk_size))
+    for values in rows:
+        yield {
+            column: value.isoformat() if hasattr(value, "isoformat") else value
+            for column, value in zip(spec.columns, values)
+        }
+
+
+def write_rows(name, rows, stream, file_format):
+    """Пишет строки в stream и возвращает их количество."""
+    written = 0
+    if file_format == "csv":
+        writer = csv.DictWriter(stream, fieldnames=SPECS[name].columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            written += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps(row, ensure_ascii=False))
+            stream.write("\n")
+            written += 1
+    return written
+
+
+class _Echo:
+    """Файл, который возвращает записанное, а не хранит его."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(name, rows):
+    """Строки CSV по одной, для StreamingHttpResponse."""
+    writer = csv.DictWriter(_Echo(), fieldnames=SPECS[name].columns)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def read_rows(stream, file_format):
+    if file_format == "csv":
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+@contextmanager
+def keep_dates(model):
+    """Отключает auto_now_add, чтобы bulk_create сохранил даты из файла."""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, "auto_now_add", False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def resolve_users(usernames, user_ids):
+    """Дополняет user_ids id пользователей, создавая недостающих."""
+    if len(user_ids) > USER_CACHE_LIMIT:
+        user_ids.clear()
+    missing = set(usernames) - user_ids.keys()
+    if not missing:
+        return
+    found = dict(User.objects.filter(username__in=missing).values_list("username", "pk"))
+    new = missing - found.keys()
+    if new:
+        User.objects.bulk_create(
+            [User(username=username, password=make_password(None)) for username in new],
+            ignore_conflicts=True
+        )
+        found.update(User.objects.filter(username__in=new).values_list("username", "pk"))
+    user_ids.update(found)
+
+
+def import_rows(name, rows, batch_size=BATCH_SIZE, progress=None):
+    """Загружает строки пачками; уже существующие строки пропускаются."""
+    spec = SPECS[name]
+    user_ids = {}
+    total = 0
+
+    def flush(batch):
+        usernames = {row[column] for row in batch for column in spec.users if row.get(column)}
+        with transaction.atomic():
+            resolve_users(usernames, user_ids)
+            spec.model.objects.bulk_create(
+                [spec.build(row, user_ids) for row in batch], ignore_conflicts=True
+            )
+
+    with keep_dates(spec.model):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush(batch)
+                total += len(batch)
+                batch = []
+                if progress:
+                    progress(total)
+        if batch:
+            flush(batch)
+            total += len(batch)
+    return total
+
+
+def rebuild():
+    """Пересчитывает всё, что обычно поддерживают сигналы."""
+    counters.rebuild_all()
+    timeline.rebuild()
+    search.rebuild()
+    trending.rebuild()
+    # Поколения лент не знают про импорт, проще сбросить кэш целиком.
+    cache.clear()
@@ -0,0 +1,106 @@
+"""Популярные посты.
+
+Публикация поста и каждый комментарий добавляют посту вес, который
+затухает вдвое за TRENDING_HALF_LIFE. Текущая популярность
+sum(w * exp(-(now - t) / tau)) у всех постов делится на один и тот же
+exp(-now / tau), поэтому для сравнения хватает sum(w * exp((t - EPOCH) / tau)):
+она от времени не зависит, и затухание учитывается лениво, без
+периодического пересчёта. Сумма хранится логарифмом,
+score = logaddexp(score, log w + (t - EPOCH) / tau), иначе экспонента
+переполнится. Топ общей ленты и ленты сообщества - чтение диапазона
+индексов TrendingScore по score и (group, score).
+"""
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F, FloatField, Func, Value
+from django.dispatch import receiver
+from django.utils import timezone
+
+from posts.models import Comment, Post, TrendingScore
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def tau():
+    return getattr(settings, "TRENDING_HALF_LIFE", 12 * 60 * 60) / math.log(2)
+
+
+def post_weight():
+    return getattr(settings, "TRENDING_POST_WEIGHT", 3)
+
+
+def size():
+    return getattr(settings, "TRENDING_SIZE", 20)
+
+
+def event_score(moment, weight=1):
+    return math.log(weight) + (moment - EPOCH).total_seconds() / tau()
+
+
+def logaddexp(a, b):
+    """log(exp(a) + exp(b)) без переполнения."""
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+class LogAddExp(Func):
+    function = "logaddexp"
+    output_field = FloatField()
+
+
+@receiver(connection_created)
+def register_functions(sender, connection, **kwargs):
+    if connection.vendor == "sqlite":
+        connection.connection.create_function("logaddexp", 2, logaddexp, deterministic=True)
+
+
+def post_created(post):
+    TrendingScore.objects.create(post=post, group_id=post.group_id,
+                                 score=event_score(post.pub_date, post_weight()))
+
+
+def post_moved(post):
+    TrendingScore.objects.filter(post_id=post.pk).update(group_id=post.group_id)
+
+
+def comment_added(comment):
+    TrendingScore.objects.filter(post_id=comment.post_id).update(
+        score=LogAddExp(F("score"), Value(event_score(comment.created)))
+    )
+
+
+def top(group=None, limit=None):
+    posts = Post.objects.for_feed()
+    if group is None:
+        posts = posts.filter(trending__score__isnull=False)
+    else:
+        posts = posts.filter(trending__group=group)
+    return posts.order_by("-trending__score")[:limit or size()]
+
+
+@transaction.atomic
+def rebuild(chunk_size=1000):
+    """Пересчитывает популярность всех постов по их комментариям."""
+    TrendingScore.objects.all().delete()
+    last = 0
+    total = 0
+    while True:
+        chunk = list(Post.objects.filter(pk__gt=last).order_by("pk")
+                     .values_list("pk", "group_id", "pub_date")[:chunk_size])
+        if not chunk:
+            return total
+        scores = {pk: event_score(pub_date, post_weight()) for pk, _, pub_date in chunk}
+        comments = (Comment.objects.filter(post_id__in=scores).order_by()
+                    .values_list("post_id", "created"))
+        for post_id, created in comments:
+            scores[post_id] = logaddexp(scores[post_id], event_score(created))
+        TrendingScore.objects.bulk_create(
+            TrendingScore(post_id=pk, group_id=group_id, score=scores[pk])
+            for pk, group_id, _ in chunk
+        )
+        total += len(chunk)
+        last = chunk[-1][0]
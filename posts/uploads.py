@@ -0,0 +1,120 @@
+"""Приём картинок постов с ограничением размера.
+
+Загрузка пишется на диск кусками и обрывается, как только превысит
+UPLOAD_MAX_SIZE. Размеры картинки берутся из заголовка без декодирования
+всего изображения, слишком большие оригиналы уменьшаются, а при
+перекодировании отбрасываются метаданные (EXIF с геометкой и т.п.).
+"""
+import os
+from io import BytesIO
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, ImageOps
+
+FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+
+
+def upload_max_size():
+    return getattr(settings, "UPLOAD_MAX_SIZE", 20 * 1024 * 1024)
+
+
+class BoundedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет файл во временный файл и перестаёт писать после лимита."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.oversized = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > upload_max_size():
+            # Остаток запроса читаем, но на диск уже не пишем.
+            self.oversized = True
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.oversized = self.oversized
+        return upload
+
+
+class BoundedImageField(forms.ImageField):
+    default_error_messages = {
+        "oversized": "Файл больше %(limit)s МБ.",
+        "too_many_pixels": "Картинка слишком большая: %(width)s×%(height)s.",
+    }
+
+    def to_python(self, data):
+        f = forms.FileField.to_python(self, data)
+        if f is None:
+            return None
+        if getattr(f, "oversized", False):
+            raise ValidationError(
+                self.error_messages["oversized"], code="oversized",
+                params={"limit": upload_max_size() // (1024 * 1024)}
+            )
+        source = (f.temporary_file_path() if hasattr(f, "temporary_file_path")
+                  else BytesIO(f.read()))
+        try:
+            # open() читает только заголовок, пиксели ещё не декодированы.
+            image = Image.open(source)
+        except Exception as exc:
+            raise ValidationError(
+                self.error_messages["invalid_image"], code="invalid_image"
+            ) from exc
+        with image:
+            width, height = image.size
+            if image.format not in FORMATS:
+                raise ValidationError(
+                    self.error_messages["invalid_image"], code="invalid_image"
+                )
+            if width * height > getattr(settings, "UPLOAD_MAX_PIXELS", 50_000_000):
+                raise ValidationError(
+                    self.error_messages["too_many_pixels"], code="too_many_pixels",
+                    params={"width": width, "height": height}
+                )
+            try:
+                return normalize(image, f)
+            except Exception as exc:
+                raise ValidationError(
+                    self.error_messages["invalid_image"], code="invalid_image"
+                ) from exc
+
+
+def normalize(image, upload):
+    """Уменьшает картинку до UPLOAD_IMAGE_MAX_SIDE и перекодирует без метаданных."""
+    max_side = getattr(settings, "UPLOAD_IMAGE_MAX_SIDE", 2048)
+    output_format = "WEBP" if getattr(settings, "UPLOAD_IMAGE_WEBP", False) else image.format
+    if image.format == "GIF" and getattr(image, "is_animated", False):
+        # При перекодировании анимация потеряется, такие файлы храним как есть.
+        output_format = "GIF"
+        upload.seek(0)
+        content = upload.read()
+    else:
+        if image.format == "JPEG":
+            # draft() декодирует JPEG сразу в уменьшенном масштабе.
+            image.draft("RGB", (max_side, max_side))
+        icc_profile = image.info.get("icc_profile")
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if output_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        options = {}
+        if output_format in ("JPEG", "WEBP"):
+            options.update(quality=85)
+        if icc_profile:
+            options["icc_profile"] = icc_profile
+        buffer = BytesIO()
+        image.save(buffer, output_format, **options)
+        content = buffer.getvalue()
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    result = SimpleUploadedFile(f"{stem}.{FORMATS[output_format]}", content,
+                                content_type=Image.MIME.get(output_format))
+    result.image = image
+    return result
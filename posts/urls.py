@@ -1,12 +1,25 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("group/<str:slug>", views.group_posts, name="group"),
+    path("group/<str:slug>/trending/", views.group_trending, name="group_trending"),
+    path("trending/", views.trending_posts, name="trending"),
     path("new", views.new_post, name="new_post"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("search/", views.search_posts, name="search"),
+    path("api/v1/posts/", api.posts, name="api_posts"),
+    path("api/v1/posts/<int:post_id>/", api.post_detail, name="api_post"),
+    path("api/v1/posts/<int:post_id>/comments/", api.post_comments, name="api_post_comments"),
+    path("api/v1/groups/", api.groups, name="api_groups"),
+    path("api/v1/groups/<str:slug>/posts/", api.group_posts, name="api_group_posts"),
+    path("api/v1/users/<str:username>/", api.user_detail, name="api_user"),
+    path("api/v1/users/<str:username>/posts/", api.user_posts, name="api_user_posts"),
+    path("api/v1/users/<str:username>/following/", api.user_following, name="api_user_following"),
+    path("api/v1/users/<str:username>/followers/", api.user_followers, name="api_user_followers"),
+    path("api/v1/follow/", api.follow_feed, name="api_follow"),
     path("<str:username>/", views.profile, name="profile"),
     path("<str:username>/<int:post_id>/", views.post_view, name="post"),
     path(
@@ -15,6 +28,7 @@ urlpatterns = [
         name="post_edit"
     ),
     path("<str:username>/<int:post_id>/comment/", views.add_comment, name="add_comment"),
+    path("<str:username>/<int:post_id>/comments/", views.post_comments, name="post_comments"),
     path("<str:username>/follow/", views.profile_follow, name="profile_follow"),
     path("<str:username>/unfollow/", views.profile_unfollow, name="profile_unfollow"),
 ]
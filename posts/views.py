@@ -1,11 +1,43 @@
+import hashlib
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-from django.core.paginator import Paginator
+from django.contrib.auth.views import redirect_to_login
+from django.db import transaction
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
 from django.contrib.auth.models import User
 
+from posts import (caching, concurrency, counters, follows, streaming, thumbnails, timeline,
+                   trending)
 from posts.models import Post, Group, Follow
+from posts.caching import cached_feed, feed_etag
 from posts.forms import PostForm, CommentForm
+from posts.paginator import CursorPaginator, paginate
+from posts.search import SearchPaginator
+
+COMMENTS_PER_PAGE = getattr(settings, "COMMENTS_PER_PAGE", 20)
+
+
+def comments_page(request, post):
+    """Страница комментариев поста по курсору ?comments=, от старых к новым."""
+    comments = post.comments.select_related("author")
+    paginator = CursorPaginator(comments, COMMENTS_PER_PAGE, ordering=("created", "id"))
+    return paginator.get_page(request.GET.get("comments"))
+
+
+def render_feed(request, template_name, posts, context=None, paginator_class=CursorPaginator):
+    """Страница ленты целиком или, при STREAM_FEEDS, потоком."""
+    context = dict(context or {})
+    if streaming.enabled(request):
+        return streaming.render_stream(request, template_name, context, paginator_class(posts))
+    page, paginator = paginate(request, posts, paginator_class=paginator_class)
+    context.update(page=page, paginator=paginator)
+    return render(request, template_name, context)
 
 
 def page_not_found(request, exception):
@@ -21,35 +53,52 @@ def server_error(request):
     return render(request, "misc/500.html", status=500)
 
 
-@cache_page(20)
+@vary_on_cookie
+@condition(etag_func=feed_etag(lambda: ["index"]))
+@cached_feed(lambda: ["index"])
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    return render_feed(request, "index.html", Post.objects.for_feed())
+
+
+@vary_on_cookie
+@condition(etag_func=feed_etag(lambda slug: [f"group:{slug}"]))
+@cached_feed(lambda slug: [f"group:{slug}"])
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return render_feed(request, "group.html", group.posts.for_feed(), {"group": group})
+
+
+@vary_on_cookie
+@condition(etag_func=feed_etag(lambda: ["trending"]))
+@cached_feed(lambda: ["trending"])
+def trending_posts(request):
+    return render(request, "trending.html", {"posts": trending.top()})
+
+
+@vary_on_cookie
+@condition(etag_func=feed_etag(lambda slug: [f"trending:{slug}"]))
+@cached_feed(lambda slug: [f"trending:{slug}"])
+def group_trending(request, slug):
+    group = get_object_or_404(Group, slug=slug)
     return render(
         request,
-        "index.html",
+        "trending.html",
         {
-            "page": page,
-            "paginator": paginator
+            "group": group,
+            "posts": trending.top(group)
         }
     )
 
 
-def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+def search_posts(request):
+    query = request.GET.get("q", "").strip()
+    page = SearchPaginator(query).get_page(request.GET.get("cursor"))
     return render(
         request,
-        "group.html",
+        "search.html",
         {
-            "group": group,
-            "page": page,
-            "paginator": paginator
+            "query": query,
+            "page": page
         }
     )
 
@@ -57,36 +106,42 @@ def group_posts(request, slug):
 @login_required
 def new_post(request):
     if request.method == "POST":
-        form = PostForm(data=request.POST)
+        form = PostForm(data=request.POST, files=request.FILES or None)
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            if post.image:
+                thumbnails.schedule(post.image.name)
             return redirect("index")
         return render(request, "new_post.html", {"form": form})
     form = PostForm()
     return render(request, "new_post.html", {"form": form})
 
 
+@vary_on_cookie
+@condition(etag_func=feed_etag(lambda username: [f"profile:{username}"]))
+@cached_feed(lambda username: [f"profile:{username}"])
 def profile(request, username):
     user_req = get_object_or_404(User, username=username)
-    posts = user_req.posts.all()
-    following = user_req.following.all()
-    follow = False
-    authors = []
-    for aut in following:
-        author = aut.user
-        authors.append(author)
-    if request.user in authors:
-        follow = True
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    if streaming.enabled(request):
+        # Посты пойдут потоком, заранее нужны только счётчики и подписка.
+        return render_feed(request, "profile.html", user_req.posts.for_feed(), {
+            "user_req": user_req,
+            "stats": counters.stats_for(user_req),
+            "follow": follows.is_following(request.user, user_req),
+        })
+    (page, paginator), stats, follow = concurrency.gather(
+        lambda: paginate(request, user_req.posts.for_feed()),
+        lambda: counters.stats_for(user_req),
+        lambda: follows.is_following(request.user, user_req),
+    )
     return render(
         request,
         "profile.html",
         {
             "user_req": user_req,
+            "stats": stats,
             "page": page,
             "paginator": paginator,
             "follow": follow
@@ -94,32 +149,82 @@ def profile(request, username):
     )
 
 
-def post_view(request, username, post_id):
-    user_req = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
-    form = CommentForm()
+def get_post(username, post_id):
+    """Пост по его единственному адресу: username должен быть автором."""
+    return get_object_or_404(Post.objects.for_feed(), pk=post_id,
+                             author__username=username)
+
+
+def render_post(request, post, form, status=200):
     return render(
         request,
         "post.html",
         {
-            "user_req": user_req,
+            "user_req": post.author,
+            "stats": counters.stats_for(post.author),
             "post": post,
-            "comments": comments,
+            "comments": comments_page(request, post),
             "form": form
+        },
+        status=status
+    )
+
+
+def post_etag(request, username, post_id):
+    """Версия поста (правки и комментарии) и поколение профиля автора."""
+    version = (Post.objects.filter(pk=post_id, author__username=username)
+               .values_list("version", flat=True).first())
+    if version is None:
+        return None
+    return post_version_etag(request, username, version)
+
+
+def post_version_etag(request, username, version):
+    generation = caching.etag_for(request, [f"profile:{username}"])
+    if generation is None:
+        return None
+    return f"{version}.{generation}"
+
+
+@vary_on_cookie
+@condition(etag_func=post_etag)
+def post_view(request, username, post_id):
+    post = get_post(username, post_id)
+    response = render_post(request, post, CommentForm())
+    if not response.has_header("ETag"):
+        # Как в cached_feed: поколение профиля заводим только после ответа 200.
+        caching.start(f"profile:{username}")
+        etag = post_version_etag(request, username, post.version)
+        if etag is not None:
+            response["ETag"] = quote_etag(etag)
+    return response
+
+
+def post_comments(request, username, post_id):
+    """Следующая страница комментариев фрагментом HTML для подгрузки."""
+    post = get_post(username, post_id)
+    return render(
+        request,
+        "comment_list.html",
+        {
+            "post": post,
+            "comments": comments_page(request, post)
         }
     )
 
 
 def post_edit(request, username, post_id):
-    edit_post = get_object_or_404(Post, pk=post_id)
+    edit_post = get_post(username, post_id)
     if edit_post.author == request.user:
         if request.method == "POST":
             form = PostForm(request.POST, files=request.FILES or None, instance=edit_post)
             if form.is_valid():
-                form.save()
+                post = form.save()
+                if "image" in form.changed_data and post.image:
+                    thumbnails.schedule(post.image.name)
                 return redirect("post", username, post_id)
-        form = PostForm(instance=edit_post)
+        else:
+            form = PostForm(instance=edit_post)
         return render(
             request,
             "new_post.html",
@@ -133,82 +238,75 @@ def post_edit(request, username, post_id):
     return redirect("post", username, post_id)
 
 
-@login_required
+def wants_json(request):
+    return request.is_ajax() or "application/json" in request.META.get("HTTP_ACCEPT", "")
+
+
 def add_comment(request, username, post_id):
-    user_req = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
-    if request.method == "POST":
-        form = CommentForm(data=request.POST)
-        if form.is_valid():
-            comment = form.save(commit=False)
-            comment.author = request.user
-            comment.post = post
-            comment.save()
-            return redirect("post", username, post_id)
-        return render(
-            request,
-            "post.html",
-            {
-                "user_req": user_req,
-                "post": post,
-                "form": form,
-                "comments": comments
-            }
-        )
-    form = CommentForm()
-    return render(
-        request,
-        "post.html",
-        {
-            "user_req": user_req,
-            "post": post,
-            "form": form,
-            "comments": comments
-        }
-    )
+    """Добавляет комментарий; принимает только POST.
+
+    Обычная форма получает редирект на страницу поста, а запрос из
+    JavaScript - JSON с новым числом комментариев и HTML самого
+    комментария, без рендеринга всей страницы.
+    """
+    post = get_post(username, post_id)
+    if request.method != "POST":
+        # Сюда вели ссылки старых карточек, у поста одна страница.
+        return redirect("post", username, post_id, permanent=True)
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    form = CommentForm(data=request.POST)
+    if not form.is_valid():
+        if wants_json(request):
+            return JsonResponse({"errors": form.errors}, status=400)
+        return render_post(request, post, form, status=400)
 
+    comment = form.save(commit=False)
+    comment.author = request.user
+    comment.post = post
+    # Комментарий, счётчик и версия карточки поста записываются вместе.
+    with transaction.atomic():
+        comment.save()
+        comments_count = (Post.objects.filter(pk=post.pk)
+                          .values_list("comments_count", flat=True).get())
+    if not wants_json(request):
+        return redirect("post", username, post_id)
+    html = render_to_string("comment_list.html",
+                            {"post": post, "comments": [comment]}, request=request)
+    return JsonResponse({
+        "id": comment.pk,
+        "comments_count": comments_count,
+        "html": html
+    }, status=201)
+
+
+def follow_etag(request):
+    """Номера и версии постов страницы: тот же запрос, что и у ленты, но без
+    авторов, сообществ и шаблонов."""
+    entries = Post.objects.values("id", "pub_date", "version")
+    page, _ = paginate(request, entries, paginator_class=timeline.paginator(request.user))
+    signature = ",".join(f"{entry['id']}.{entry['version']}" for entry in page)
+    digest = hashlib.md5(signature.encode()).hexdigest()
+    return f"{digest}-{request.user.pk}"
 
 
 @login_required
+@vary_on_cookie
+@condition(etag_func=follow_etag)
 def follow_index(request):
-    user = get_object_or_404(User, username=request.user)
-    followings = user.follower.all()
-    authors = set()
-    for aut in followings:
-        author = aut.author
-        authors.add(author)
-    post_list = Post.objects.filter(author__in=authors)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    return render(
-        request,
-        "follow.html",
-        {
-            "page": page,
-            "paginator": paginator,
-            "followings": followings
-        }
-    )
+    return render_feed(request, "follow.html", Post.objects.for_feed(),
+                       paginator_class=timeline.paginator(request.user))
 
 @login_required
 def profile_follow(request, username):
-    user = get_object_or_404(User, username=request.user)
     author = get_object_or_404(User, username=username)
-    if user == author:
-        return redirect("profile", username)
-    follow = Follow.objects.filter(user=user, author=author)
-    if len(follow) > 0:
-        return redirect("profile", username)
-    Follow.objects.create(user=user, author=author)
+    if request.user != author:
+        Follow.objects.get_or_create(user=request.user, author=author)
     return redirect("profile", username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    user = get_object_or_404(User, username=request.user)
     author = get_object_or_404(User, username=username)
-    follow = Follow.objects.filter(user=user, author=author)
-    follow.delete()
+    Follow.objects.filter(user=request.user, author=author).delete()
     return redirect("profile", username)
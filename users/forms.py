@@ -1,5 +1,7 @@
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.urls import Resolver404, resolve
 
 
 User = get_user_model()
@@ -10,3 +12,14 @@ class CreationForm(UserCreationForm):
         model = User
         fields = ("first_name", "last_name", "username", "email")
 
+    def clean_username(self):
+        username = self.cleaned_data["username"]
+        # Профиль живёт по адресу /<username>/, поэтому имя не должно
+        # совпадать с другими адресами сайта, например /search/.
+        try:
+            match = resolve(f"/{username}/")
+        except Resolver404:
+            return username
+        if match.url_name != "profile":
+            raise ValidationError("Это имя занято адресом сайта", code="reserved")
+        return username
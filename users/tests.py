@@ -1,3 +1,27 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from .forms import CreationForm
+
+
+class SignUpTest(TestCase):
+    def form(self, username):
+        return CreationForm({"username": username, "password1": "Zx9!kq7Lm2",
+                             "password2": "Zx9!kq7Lm2"})
+
+    def test_site_paths_are_reserved(self):
+        for username in ["search", "trending", "follow"]:
+            with self.subTest(username=username):
+                form = self.form(username)
+                self.assertFalse(form.is_valid())
+                self.assertEqual(form.errors.as_data()["username"][0].code, "reserved")
+
+    def test_regular_username(self):
+        self.assertTrue(self.form("reader").is_valid())
+
+    def test_signup_rejects_reserved_name(self):
+        response = self.client.post(reverse("signup"), {
+            "username": "search", "password1": "Zx9!kq7Lm2", "password2": "Zx9!kq7Lm2"})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(User.objects.filter(username="search").exists())
@@ -0,0 +1,137 @@
+"""
+ASGI config for yatube project.
+
+Django 2.2 не умеет ASGI, поэтому здесь небольшой адаптер: запрос
+собирается в WSGI environ и обрабатывается обычным WSGIHandler в
+ограниченном пуле из ASGI_THREADS потоков, а цикл событий только
+принимает и отдаёт байты. Медленный клиент не держит поток, а запросы
+сверх размера пула ждут в очереди, не плодя потоков. Весь запрос,
+включая отдачу потокового ответа, выполняется в одном потоке пула, там
+же закрываются его соединения с базой.
+
+    uvicorn yatube.asgi:application
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+from django.conf import settings  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+
+from yatube.staticfiles import wrap  # noqa: E402
+
+wsgi_application = wrap(get_wsgi_application())
+executor = ThreadPoolExecutor(max_workers=getattr(settings, "ASGI_THREADS", 16),
+                              thread_name_prefix="asgi")
+
+
+class Disconnected(Exception):
+    pass
+
+
+def build_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        # WSGI хранит путь байтами в latin-1, Django сам раскодирует его как UTF-8.
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "REMOTE_ADDR": client[0],
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = f"HTTP_{key}"
+        value = value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    """Тело запроса; большое уходит с памяти во временный файл."""
+    body = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            body.close()
+            raise Disconnected
+        body.write(message.get("body", b""))
+        if not message.get("more_body"):
+            body.seek(0)
+            return body
+
+
+def run_wsgi(environ, put):
+    """Выполняет запрос в потоке пула и отдаёт сообщения ASGI через put."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                               for name, value in headers]
+
+    try:
+        result = wsgi_application(environ, start_response)
+        try:
+            put({"type": "http.response.start", "status": response["status"],
+                 "headers": response["headers"]})
+            for chunk in result:
+                if chunk:
+                    put({"type": "http.response.body", "body": chunk, "more_body": True})
+            put({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+    finally:
+        environ["wsgi.input"].close()
+        put(None)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        raise ValueError(f"Неподдерживаемый тип соединения: {scope['type']}")
+    try:
+        body = await read_body(receive)
+    except Disconnected:
+        return
+    loop = asyncio.get_running_loop()
+    # Очередь без ограничения: поток не должен ждать ушедшего клиента.
+    messages = asyncio.Queue()
+    task = loop.run_in_executor(executor, run_wsgi, build_environ(scope, body),
+                                lambda message: loop.call_soon_threadsafe(
+                                    messages.put_nowait, message))
+    while True:
+        message = await messages.get()
+        if message is None:
+            break
+        await send(message)
+    await task
@@ -0,0 +1,49 @@
+"""Сжатие потоковых ответов.
+
+GZipMiddleware из Django сжимает поток одним GzipFile без сброса, и zlib
+держит начало страницы в буфере, пока не наберёт блок: шапка ленты
+дошла бы до браузера не раньше всей страницы. Здесь каждый кусок
+сжимается с Z_SYNC_FLUSH и уходит сразу, ценой чуть худшего сжатия.
+Обычные ответы не трогаем, их сжимает веб-сервер.
+"""
+import re
+import zlib
+
+from django.utils.cache import patch_vary_headers
+
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+COMPRESSIBLE = ("text/", "application/json", "application/javascript")
+LEVEL = 6
+
+
+def compress_stream(chunks, level=LEVEL):
+    # 16 + MAX_WBITS - заголовок и контрольная сумма gzip, а не голый deflate.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class StreamingGZipMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (not response.streaming or response.has_header("Content-Encoding")
+                or not response.get("Content-Type", "").startswith(COMPRESSIBLE)):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if not ACCEPTS_GZIP.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+            return response
+        response.streaming_content = compress_stream(response.streaming_content)
+        if response.has_header("Content-Length"):
+            del response["Content-Length"]
+        # Сжатое тело уже не то же побайтно, ETag остаётся только слабым.
+        etag = response.get("ETag")
+        if etag and not etag.startswith("W/"):
+            response["ETag"] = f"W/{etag}"
+        response["Content-Encoding"] = "gzip"
+        return response
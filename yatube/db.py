@@ -0,0 +1,32 @@
+"""Настройка соединений с базой.
+
+Прагмы SQLITE_PRAGMAS выполняются на каждом новом соединении SQLite
+(WAL, synchronous, mmap). Для постоянных соединений (CONN_MAX_AGE > 0)
+при CONN_HEALTH_CHECKS в настройках базы соединение проверяется в начале
+каждого запроса и закрывается, если сервер его уже оборвал; в Django 2.2
+такой настройки ещё нет.
+"""
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+        connection.connection.execute(f"PRAGMA {name} = {value}")
+
+
+def check_connections(**kwargs):
+    for connection in connections.all():
+        if (connection.settings_dict.get("CONN_HEALTH_CHECKS")
+                and connection.connection is not None
+                and not connection.is_usable()):
+            connection.close()
+
+
+def install():
+    connection_created.connect(configure_sqlite, dispatch_uid="yatube.db.configure_sqlite")
+    request_started.connect(check_connections, dispatch_uid="yatube.db.check_connections")
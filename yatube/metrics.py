@@ -0,0 +1,277 @@
+"""Лёгкие метрики запросов для продакшена.
+
+MetricsMiddleware меряет время ответа каждого запроса, а у доли запросов
+METRICS_SAMPLE_RATE ещё и число и время SQL-запросов, время рендеринга
+шаблонов и попадания в кэш. Всё копится в памяти процесса по имени view
+и отдаётся в текстовом формате Prometheus на /metrics (у каждого процесса
+свои числа, метка pid их различает). Запросы, которые сделали больше
+SQL-запросов, чем разрешено порогом, пишутся в лог как предупреждения.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.base import Template
+
+logger = logging.getLogger("yatube.metrics")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+MISSING = object()
+
+_local = threading.local()
+_lock = threading.Lock()
+_views = {}
+_installed = False
+
+
+def sample_rate():
+    return getattr(settings, "METRICS_SAMPLE_RATE", 0.1)
+
+
+def query_threshold(view_name):
+    thresholds = getattr(settings, "METRICS_QUERY_THRESHOLDS", {})
+    return thresholds.get(view_name, getattr(settings, "METRICS_QUERY_THRESHOLD", 50))
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.in_get_many = False
+
+
+def current():
+    """Статистика текущего запроса, если он попал в выборку."""
+    return getattr(_local, "stats", None)
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, context):
+        stats = current()
+        if stats is None:
+            return render(self, context)
+        # Вложенные шаблоны (include) уже входят во время внешнего.
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_time += time.perf_counter() - started
+    return wrapper
+
+
+def _counted_get(get):
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        value = get(self, key, MISSING, version=version)
+        stats = current()
+        # Базовый get_many зовёт get по ключу, такие чтения уже посчитаны.
+        if stats is not None and not stats.in_get_many:
+            if value is MISSING:
+                stats.cache_misses += 1
+            else:
+                stats.cache_hits += 1
+        return default if value is MISSING else value
+    wrapper.counted = True
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @wraps(get_many)
+    def wrapper(self, keys, version=None):
+        keys = list(keys)
+        stats = current()
+        if stats is None or stats.in_get_many:
+            return get_many(self, keys, version=version)
+        stats.in_get_many = True
+        try:
+            found = get_many(self, keys, version=version)
+        finally:
+            stats.in_get_many = False
+        stats.cache_hits += len(found)
+        stats.cache_misses += len(keys) - len(found)
+        return found
+    wrapper.counted = True
+    return wrapper
+
+
+def install():
+    """Оборачивает рендеринг шаблонов и чтение из кэша счётчиками."""
+    global _installed
+    with _lock:
+        if _installed:
+            return
+        Template.render = _timed_render(Template.render)
+        backends = {type(caches[alias]) for alias in settings.CACHES}
+        for backend in backends:
+            # Метод, унаследованный от уже обёрнутого предка, второй раз не оборачиваем.
+            if not hasattr(backend.get, "counted"):
+                backend.get = _counted_get(backend.get)
+            if not hasattr(backend.get_many, "counted"):
+                backend.get_many = _counted_get_many(backend.get_many)
+        _installed = True
+
+
+def record_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats = current()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += time.perf_counter() - started
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else "<unresolved>"
+
+
+def record(name, elapsed, stats):
+    with _lock:
+        view = _views.get(name)
+        if view is None:
+            view = _views[name] = {
+                "requests": 0, "seconds": 0.0, "buckets": [0] * len(BUCKETS),
+                "sampled": 0, "queries": 0, "db_seconds": 0.0,
+                "template_seconds": 0.0, "cache_hits": 0, "cache_misses": 0,
+                "over_threshold": 0,
+            }
+        view["requests"] += 1
+        view["seconds"] += elapsed
+        for number, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                view["buckets"][number] += 1
+        if stats is not None:
+            view["sampled"] += 1
+            view["queries"] += stats.queries
+            view["db_seconds"] += stats.db_time
+            view["template_seconds"] += stats.template_time
+            view["cache_hits"] += stats.cache_hits
+            view["cache_misses"] += stats.cache_misses
+            if stats.queries > query_threshold(name):
+                view["over_threshold"] += 1
+
+
+def snapshot():
+    with _lock:
+        return {name: dict(view, buckets=list(view["buckets"]))
+                for name, view in _views.items()}
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        if random.random() >= sample_rate():
+            response = self.get_response(request)
+            record(view_name(request), time.perf_counter() - started, None)
+            return response
+
+        stats = _local.stats = RequestStats()
+        try:
+            with wrap_connections():
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+        elapsed = time.perf_counter() - started
+        name = view_name(request)
+        record(name, elapsed, stats)
+        self.log(request, response, name, elapsed, stats)
+        return response
+
+    def log(self, request, response, name, elapsed, stats):
+        line = {
+            "view": name,
+            "path": request.path,
+            "status": response.status_code,
+            "ms": round(elapsed * 1000, 2),
+            "queries": stats.queries,
+            "db_ms": round(stats.db_time * 1000, 2),
+            "template_ms": round(stats.template_time * 1000, 2),
+            "cache_hits": stats.cache_hits,
+            "cache_misses": stats.cache_misses,
+        }
+        if stats.queries > query_threshold(name):
+            logger.warning("Слишком много SQL-запросов: %s", json.dumps(line))
+        elif getattr(settings, "METRICS_LOG_REQUESTS", False):
+            logger.info(json.dumps(line))
+
+
+def wrap_connections(wrapper=record_query):
+    """execute_wrapper для всех баз сразу."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+    return stack
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_prometheus():
+    pid = os.getpid()
+    lines = []
+    counters = [
+        ("yatube_requests_total", "counter", "Запросы", "requests"),
+        ("yatube_sampled_requests_total", "counter", "Запросы в выборке", "sampled"),
+        ("yatube_db_queries_total", "counter", "SQL-запросы в выборке", "queries"),
+        ("yatube_db_seconds_total", "counter", "Время SQL в выборке", "db_seconds"),
+        ("yatube_template_seconds_total", "counter", "Рендеринг шаблонов в выборке",
+         "template_seconds"),
+        ("yatube_cache_hits_total", "counter", "Попадания в кэш в выборке", "cache_hits"),
+        ("yatube_cache_misses_total", "counter", "Промахи кэша в выборке", "cache_misses"),
+        ("yatube_query_threshold_exceeded_total", "counter",
+         "Запросы сверх порога SQL-запросов", "over_threshold"),
+    ]
+    views = snapshot()
+    for metric, kind, description, field in counters:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, view in sorted(views.items()):
+            lines.append(f'{metric}{{view="{_escape(name)}",pid="{pid}"}} {view[field]}')
+
+    metric = "yatube_request_seconds"
+    lines.append(f"# HELP {metric} Время ответа")
+    lines.append(f"# TYPE {metric} histogram")
+    for name, view in sorted(views.items()):
+        labels = f'view="{_escape(name)}",pid="{pid}"'
+        for bound, total in zip(BUCKETS, view["buckets"]):
+            lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {view["requests"]}')
+        lines.append(f"{metric}_sum{{{labels}}} {view['seconds']}")
+        lines.append(f"{metric}_count{{{labels}}} {view['requests']}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics(request):
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", settings.INTERNAL_IPS)
+    if request.META.get("REMOTE_ADDR") not in allowed and not request.user.is_staff:
+        raise Http404
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4")
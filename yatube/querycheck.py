@@ -0,0 +1,150 @@
+"""Поиск N+1 и медленных SQL-запросов.
+
+QueryLog через execute_wrapper запоминает каждый запрос вместе с его
+«формой» (SQL без чисел и с IN-списками любой длины) и местом, откуда он
+пришёл: строкой шаблона, если запрос сделан при рендеринге, или строкой
+кода проекта. Одна и та же форма, повторённая много раз за запрос, почти
+всегда означает N+1.
+
+QueryCheckMiddleware пишет такие запросы в лог (по умолчанию только при
+DEBUG), а QueryBudgetMixin даёт тестам assertQueryBudget, который валит
+тест при превышении бюджета запросов и показывает, откуда они взялись.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.base import Node
+
+from yatube.metrics import wrap_connections
+
+logger = logging.getLogger("yatube.querycheck")
+
+NUMBERS = re.compile(r"\b\d+\b")
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Обёртки запросов сами вызывают execute, их строки места не показывают.
+INSTRUMENTATION = {os.path.join(PROJECT_DIR, "yatube", name)
+                   for name in ("metrics.py", "querycheck.py")}
+
+Query = namedtuple("Query", "shape sql duration origin")
+
+
+def repeat_threshold():
+    return getattr(settings, "QUERYCHECK_REPEATS", 5)
+
+
+def slow_threshold():
+    return getattr(settings, "QUERYCHECK_SLOW_MS", 100) / 1000
+
+
+def shape(sql):
+    return NUMBERS.sub("?", IN_LIST.sub("IN (...)", sql))
+
+
+def _is_project_file(filename):
+    return (filename.startswith(PROJECT_DIR) and "site-packages" not in filename
+            and filename not in INSTRUMENTATION)
+
+
+def origin(frame=None):
+    """Тег шаблона или строка кода проекта, ближайшие к месту запроса."""
+    frame = frame or sys._getframe(1)
+    while frame is not None:
+        node = frame.f_locals.get("self")
+        # type(), а не isinstance: isinstance у ленивого объекта (request.user)
+        # вычислит его, а это новый запрос изнутри обёртки.
+        if issubclass(type(node), Node) and getattr(node, "token", None) is not None:
+            template = getattr(node.origin, "template_name", None) or "<шаблон>"
+            return f"{template}:{node.token.lineno} {node.token.contents}"
+        code = frame.f_code
+        if _is_project_file(code.co_filename):
+            path = os.path.relpath(code.co_filename, PROJECT_DIR)
+            return f"{path}:{frame.f_lineno} {code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(Query(shape(sql), sql, time.perf_counter() - started,
+                                      origin(sys._getframe(1))))
+
+    def __len__(self):
+        return len(self.queries)
+
+    def repeated(self, threshold):
+        """Формы, встретившиеся не меньше threshold раз: [(форма, число, места)]."""
+        shapes = Counter(query.shape for query in self.queries)
+        result = []
+        for query_shape, total in shapes.most_common():
+            if total < threshold:
+                break
+            origins = Counter(query.origin for query in self.queries
+                              if query.shape == query_shape)
+            result.append((query_shape, total, origins))
+        return result
+
+    def slow(self, threshold):
+        return [query for query in self.queries if query.duration >= threshold]
+
+    def report(self, repeats):
+        lines = []
+        for query_shape, total, origins in self.repeated(repeats):
+            lines.append(f"{total}× {query_shape}")
+            for place, count in origins.most_common(3):
+                lines.append(f"    {count}× из {place}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def capture():
+    log = QueryLog()
+    with wrap_connections(log):
+        yield log
+
+
+class QueryCheckMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, "QUERYCHECK_ENABLED", settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with capture() as log:
+            response = self.get_response(request)
+        report = log.report(repeat_threshold())
+        if report:
+            logger.warning("Повторяющиеся запросы на %s:\n%s", request.path, report)
+        for query in log.slow(slow_threshold()):
+            logger.warning("Медленный запрос на %s (%.0f мс) из %s: %s",
+                           request.path, query.duration * 1000, query.origin, query.sql)
+        return response
+
+
+class QueryBudgetMixin:
+    """assertQueryBudget для TestCase."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, repeats=None):
+        """Не больше budget запросов и, если задано, не больше repeats одной формы."""
+        with capture() as log:
+            yield log
+        if len(log) > budget:
+            self.fail(f"{len(log)} SQL-запросов при бюджете {budget}\n{log.report(2)}")
+        if repeats is not None and log.repeated(repeats + 1):
+            self.fail(f"Запросы одной формы повторяются больше {repeats} раз\n"
+                      f"{log.report(repeats + 1)}")
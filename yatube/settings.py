@@ -48,11 +48,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    'debug_toolbar',
-
 ]
 
 MIDDLEWARE = [
+    'yatube.metrics.MetricsMiddleware',
+    'yatube.querycheck.QueryCheckMiddleware',
+    'yatube.compression.StreamingGZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,9 +61,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
@@ -149,10 +153,77 @@ SITE_ID = 1
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'default.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
     }
 }
 
+# Тесты очищают кэш, поэтому работают с временной копией его файла.
+TEST_RUNNER = 'yatube.testrunner.TempCacheRunner'
+
 INTERNAL_IPS = [
     "127.0.0.1",
-]
\ No newline at end of file
+]
+
+# Авторы, у которых подписчиков больше этого числа, не раскладываются
+# по лентам при публикации, а подмешиваются в ленту при чтении.
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BACKFILL = 100
+# Сколько последних записей хранится в ленте каждого пользователя.
+TIMELINE_SIZE = 1000
+
+# Страницы лент сбрасываются счётчиками поколений при каждой записи,
+# поэтому могут жить в кэше долго.
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Комментарии под постом подгружаются страницами такого размера.
+COMMENTS_PER_PAGE = 20
+
+# Популярное: вес события убывает вдвое за TRENDING_HALF_LIFE секунд,
+# публикация поста весит как TRENDING_POST_WEIGHT комментариев.
+# После изменения этих чисел нужно выполнить rebuild_trending.
+TRENDING_HALF_LIFE = 12 * 60 * 60
+TRENDING_POST_WEIGHT = 3
+TRENDING_SIZE = 20
+
+# Ленты отдаются потоком: шапка сразу, карточки по мере чтения постов
+# (см. posts.streaming).
+STREAM_FEEDS = False
+
+# Потоки, в которых yatube.asgi выполняет запросы.
+ASGI_THREADS = 16
+
+# Страница постов, счётчики и подписка в профиле считаются параллельно
+# в FEED_THREADS потоках (см. posts.concurrency).
+FEED_CONCURRENCY = False
+FEED_THREADS = 4
+
+# Потоки, в которых строятся миниатюры загруженных картинок;
+# 0 - строить сразу, в том же запросе.
+THUMBNAIL_WORKERS = 2
+
+# Загрузки пишутся на диск кусками и обрываются после UPLOAD_MAX_SIZE байт.
+FILE_UPLOAD_HANDLERS = ["posts.uploads.BoundedTemporaryFileUploadHandler"]
+UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+UPLOAD_MAX_PIXELS = 50_000_000
+UPLOAD_IMAGE_MAX_SIDE = 2048
+UPLOAD_IMAGE_WEBP = False
+
+# Доля запросов, у которых считаются SQL-запросы, шаблоны и кэш;
+# время ответа записывается для всех запросов.
+METRICS_SAMPLE_RATE = 0.1
+# Запросы, сделавшие больше SQL-запросов, пишутся в лог предупреждением.
+METRICS_QUERY_THRESHOLD = 50
+METRICS_QUERY_THRESHOLDS = {}
+METRICS_LOG_REQUESTS = False
+METRICS_ALLOWED_IPS = INTERNAL_IPS
+
+# Повторяющиеся (N+1) и медленные SQL-запросы пишутся в лог; детектор
+# обходит стек на каждый запрос, поэтому по умолчанию включён только при DEBUG.
+QUERYCHECK_ENABLED = DEBUG
+QUERYCHECK_REPEATS = 5
+QUERYCHECK_SLOW_MS = 100
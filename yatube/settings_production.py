@@ -0,0 +1,77 @@
+"""Настройки для продакшена.
+
+    DJANGO_SETTINGS_MODULE=yatube.settings_production
+
+Секреты, хосты и база берутся из переменных окружения. DJANGO_SECRET_KEY
+и DJANGO_ALLOWED_HOSTS обязательны: ключ из settings.py публичный.
+По умолчанию используется SQLite в режиме WAL, с DB_ENGINE=postgresql -
+PostgreSQL.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from yatube.settings import *  # noqa: F401,F403
+from yatube.settings import BASE_DIR, INSTALLED_APPS, MIDDLEWARE
+
+
+def required(name):
+    value = os.environ.get(name)
+    if not value:
+        raise ImproperlyConfigured(f"Переменная окружения {name} не задана")
+    return value
+
+
+DEBUG = os.environ.get("DJANGO_DEBUG") == "1"
+SECRET_KEY = required("DJANGO_SECRET_KEY")
+ALLOWED_HOSTS = required("DJANGO_ALLOWED_HOSTS").split(",")
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != "debug_toolbar"]
+MIDDLEWARE = [name for name in MIDDLEWARE if not name.startswith("debug_toolbar.")]
+QUERYCHECK_ENABLED = False
+
+# Имена статики с хэшем содержимого и сжатые копии рядом (collectstatic),
+# статику и загрузки отдаёт yatube.staticfiles.FileServer.
+STATICFILES_STORAGE = "yatube.staticfiles.CompressedManifestStaticFilesStorage"
+STATIC_SOURCE_DIR = os.environ.get("STATIC_SOURCE_DIR", os.path.join(BASE_DIR, "assets"))
+STATICFILES_DIRS = [STATIC_SOURCE_DIR] if os.path.isdir(STATIC_SOURCE_DIR) else []
+SERVE_FILES = True
+FILE_MAX_AGE = int(os.environ.get("FILE_MAX_AGE", 24 * 60 * 60))
+
+# Соединение живёт между запросами и проверяется перед каждым из них.
+CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", 60))
+
+if os.environ.get("DB_ENGINE") == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "yatube"),
+            "USER": os.environ.get("DB_USER", "yatube"),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", "localhost"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            "CONN_MAX_AGE": CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("DB_NAME", os.path.join(BASE_DIR, "db.sqlite3")),
+            "CONN_MAX_AGE": CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            # Сколько секунд писатель ждёт блокировку, прежде чем
+            # получить "database is locked".
+            "OPTIONS": {"timeout": 20},
+        }
+    }
+
+# WAL: читатели не ждут писателя. synchronous=NORMAL в режиме WAL не
+# теряет целостность, только последние транзакции при сбое питания.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
@@ -0,0 +1,280 @@
+"""Кэш в файле SQLite, общий для всех процессов на одной машине.
+
+LocMemCache у каждого воркера свой: кэш прогревается заново в каждом
+процессе, а сброс поколений лент не доходит до соседей. Этот бэкенд
+хранит записи в одном файле SQLite в режиме WAL, так что читатели не
+блокируют писателя, а incr() атомарен между процессами.
+
+Настройка::
+
+    CACHES = {
+        "default": {
+            "BACKEND": "yatube.sqlite_cache.SQLiteCache",
+            "LOCATION": "/var/tmp/yatube-cache.sqlite3",
+            "OPTIONS": {"MAX_ENTRIES": 100000, "MAX_SIZE": 256 * 1024 * 1024},
+        }
+    }
+
+При превышении MAX_ENTRIES или MAX_SIZE (в байтах) вытесняются записи,
+к которым дольше всего не обращались (LRU).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET entries = entries + 1, bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET entries = entries - 1, bytes = bytes - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache BEGIN
+    UPDATE cache_stats SET bytes = bytes - OLD.size + NEW.size;
+END;
+"""
+
+# Время последнего обращения обновляется не чаще этого интервала (секунды),
+# чтобы чтение почти никогда не превращалось в запись.
+ACCESS_RESOLUTION = 5
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get("OPTIONS", {})
+        self._max_size = int(options.get("MAX_SIZE", 0)) or None
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(location))
+        os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            # После fork() соединение родителя использовать нельзя.
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        connection = sqlite3.connect(self._path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def _expiry(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return None if timeout is None else float(timeout)
+
+    @staticmethod
+    def _dumps(value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT value, expires, accessed FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            self._connection().execute(
+                "DELETE FROM cache WHERE key = ? AND expires <= ?", (key, now)
+            )
+            return default
+        if now - accessed > ACCESS_RESOLUTION:
+            self._connection().execute(
+                "UPDATE cache SET accessed = ? WHERE key = ?", (now, key)
+            )
+        return pickle.loads(value)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ",".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, value FROM cache WHERE key IN ({placeholders}) "
+            "AND (expires IS NULL OR expires > ?)",
+            (*keys, now)
+        )
+        return {keys[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self._write([(key, self._dumps(value), self._expiry(timeout))])
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expiry(timeout)
+        self._write([(self._key(key, version), self._dumps(value), expires)
+                     for key, value in data.items()])
+        return []
+
+    def _write(self, rows):
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Не INSERT OR REPLACE: при замене строки он не вызывает
+            # триггер удаления, и счётчики в cache_stats разошлись бы.
+            connection.executemany(
+                "INSERT INTO cache (key, value, expires, accessed, size) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "value = excluded.value, expires = excluded.expires, "
+                "accessed = excluded.accessed, size = excluded.size",
+                [(key, value, expires, now, len(key) + len(value))
+                 for key, value, expires in rows]
+            )
+            self._cull(connection, now)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        value = self._dumps(value)
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "DELETE FROM cache WHERE key = ? AND expires <= ?", (key, now)
+            )
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expires, accessed, size) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, self._expiry(timeout), now, len(key) + len(value))
+            )
+            added = cursor.rowcount == 1
+            if added:
+                self._cull(connection, now)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        connection = self._connection()
+        # BEGIN IMMEDIATE берёт блокировку записи до чтения, поэтому
+        # параллельные incr() из разных процессов не теряют обновления.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value FROM cache WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)", (key, now)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            data = self._dumps(value)
+            connection.execute(
+                "UPDATE cache SET value = ?, accessed = ?, size = ? WHERE key = ?",
+                (data, now, len(key) + len(data), key)
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._connection().execute(
+            "UPDATE cache SET expires = ?, accessed = ? WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (self._expiry(timeout), now, key, now)
+        )
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            "SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            placeholders = ",".join("?" * len(keys))
+            self._connection().execute(
+                f"DELETE FROM cache WHERE key IN ({placeholders})", keys
+            )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Соединение переиспользуется между запросами одного потока.
+        pass
+
+    def _cull(self, connection, now):
+        entries, size = connection.execute(
+            "SELECT entries, bytes FROM cache_stats"
+        ).fetchone()
+        over_entries = entries > self._max_entries
+        over_size = self._max_size is not None and size > self._max_size
+        if not over_entries and not over_size:
+            return
+        connection.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        entries, size = connection.execute(
+            "SELECT entries, bytes FROM cache_stats"
+        ).fetchone()
+        if entries > self._max_entries:
+            # Как и остальные бэкенды Django, освобождаем сразу
+            # 1/CULL_FREQUENCY записей, чтобы не чистить на каждой записи.
+            excess = entries - self._max_entries + self._max_entries // self._cull_frequency
+            connection.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed LIMIT ?)", (excess,)
+            )
+        while self._max_size is not None and size > self._max_size:
+            connection.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed LIMIT 100)"
+            )
+            entries, size = connection.execute(
+                "SELECT entries, bytes FROM cache_stats"
+            ).fetchone()
+            if not entries:
+                break
@@ -0,0 +1,175 @@
+"""Статика и загрузки в продакшене.
+
+CompressedManifestStaticFilesStorage при collectstatic даёт файлам
+имена с хэшем содержимого и рядом кладёт сжатые копии .gz (и .br, если
+установлен brotli), чтобы не сжимать их на каждый запрос.
+
+FileServer оборачивает WSGI-приложение и отдаёт STATIC_URL и MEDIA_URL,
+не доходя до Django: список статики собирается один раз при запуске,
+файл передаётся через wsgi.file_wrapper (gunicorn и uWSGI отправляют его
+sendfile без копирования в Python). Файлы с хэшем в имени кэшируются
+браузером на год, остальные - на FILE_MAX_AGE.
+"""
+import gzip
+import json
+import mimetypes
+import os
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".html", ".xml", ".map", ".ico")
+# Сжатая копия, которая меньше оригинала едва заметно, не стоит лишнего файла.
+MIN_RATIO = 0.95
+HASHED_MAX_AGE = 365 * 24 * 60 * 60
+BLOCK_SIZE = 64 * 1024
+# Сначала более плотное сжатие.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def file_max_age():
+    return getattr(settings, "FILE_MAX_AGE", 24 * 60 * 60)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Шаблон со ссылкой на файл, которого нет в манифесте, не должен падать:
+    # имя с хэшем посчитается по самому файлу.
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in set(paths) | set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE):
+                self.compress(self.path(name))
+
+    def compress(self, path):
+        with open(path, "rb") as stream:
+            content = stream.read()
+        variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(content)))
+        for suffix, compressed in variants:
+            if len(compressed) < len(content) * MIN_RATIO:
+                with open(path + suffix, "wb") as stream:
+                    stream.write(compressed)
+
+
+class File:
+    """Файл с заранее посчитанными заголовками и сжатыми копиями."""
+
+    def __init__(self, path, max_age, immutable=False, compressed=False):
+        stat = os.stat(path)
+        content_type, _ = mimetypes.guess_type(path)
+        content_type = content_type or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript",
+                                                                "application/json"):
+            content_type += "; charset=utf-8"
+        cache_control = f"public, max-age={max_age}" + (", immutable" if immutable else "")
+        self.headers = [
+            ("Content-Type", content_type),
+            ("Cache-Control", cache_control),
+            ("Last-Modified", http_date(stat.st_mtime)),
+        ]
+        tag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        self.variants = []
+        if compressed:
+            for encoding, suffix in ENCODINGS:
+                if os.path.isfile(path + suffix):
+                    size = os.path.getsize(path + suffix)
+                    self.variants.append((encoding, path + suffix, size, f'"{tag}-{encoding}"'))
+        if self.variants:
+            self.headers.append(("Vary", "Accept-Encoding"))
+        self.variants.append((None, path, stat.st_size, f'"{tag}"'))
+
+    def choose(self, accept_encoding):
+        accepted = set()
+        for part in accept_encoding.split(","):
+            coding, _, params = part.partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0"):
+                accepted.add(coding.strip())
+        for variant in self.variants:
+            if variant[0] is None or variant[0] in accepted:
+                return variant
+
+
+def scan_static(root):
+    """Все файлы STATIC_ROOT по относительному пути (с прямыми слэшами)."""
+    hashed = set()
+    try:
+        with open(os.path.join(root, ManifestStaticFilesStorage.manifest_name)) as stream:
+            hashed = set(json.load(stream)["paths"].values())
+    except (OSError, ValueError, KeyError):
+        pass
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith((".gz", ".br")):
+                continue
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root).replace(os.sep, "/")
+            immutable = relative in hashed
+            files[relative] = File(path, HASHED_MAX_AGE if immutable else file_max_age(),
+                                   immutable=immutable, compressed=True)
+    return files
+
+
+class FileServer:
+    def __init__(self, application):
+        self.application = application
+        self.static_url = settings.STATIC_URL
+        self.media_url = settings.MEDIA_URL
+        self.static = scan_static(settings.STATIC_ROOT) if settings.STATIC_ROOT else {}
+
+    def __call__(self, environ, start_response):
+        if environ["REQUEST_METHOD"] in ("GET", "HEAD"):
+            path = environ.get("PATH_INFO", "").encode("latin-1").decode("utf-8", "replace")
+            file = self.find(path)
+            if file is not None:
+                return self.serve(file, environ, start_response)
+        return self.application(environ, start_response)
+
+    def find(self, path):
+        if path.startswith(self.static_url):
+            return self.static.get(path[len(self.static_url):])
+        if self.media_url and path.startswith(self.media_url) and settings.MEDIA_ROOT:
+            # Загрузки появляются во время работы, их ищем на диске при запросе.
+            try:
+                full = safe_join(settings.MEDIA_ROOT, path[len(self.media_url):])
+            except (SuspiciousFileOperation, ValueError):
+                return None
+            if os.path.isfile(full):
+                return File(full, file_max_age())
+        return None
+
+    def serve(self, file, environ, start_response):
+        encoding, path, size, etag = file.choose(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        headers = file.headers + [("ETag", etag)]
+        if etag in environ.get("HTTP_IF_NONE_MATCH", ""):
+            start_response("304 Not Modified", headers)
+            return []
+        headers.append(("Content-Length", str(size)))
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        start_response("200 OK", headers)
+        if environ["REQUEST_METHOD"] == "HEAD":
+            return []
+        wrapper = environ.get("wsgi.file_wrapper", FileWrapper)
+        return wrapper(open(path, "rb"), BLOCK_SIZE)
+
+
+def wrap(application):
+    """FileServer перед приложением, если SERVE_FILES включён."""
+    if getattr(settings, "SERVE_FILES", False):
+        return FileServer(application)
+    return application
@@ -0,0 +1,41 @@
+"""Запуск тестов с отдельным файловым кэшем.
+
+Кэш по умолчанию лежит в BASE_DIR/cache/default.sqlite3, а тесты
+очищают его перед каждым случаем. TempCacheRunner на время прогона
+переносит LOCATION всех кэшей во временный каталог и удаляет его после.
+"""
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TempCacheRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp(prefix="yatube-cache-")
+        cache_settings = copy.deepcopy(settings.CACHES)
+        for alias, options in cache_settings.items():
+            if "LOCATION" in options:
+                options["LOCATION"] = os.path.join(self.cache_dir, f"{alias}.sqlite3")
+        self.cache_override = override_settings(CACHES=cache_settings)
+        self.cache_override.enable()
+        # В Django 2.2 смена CACHES не пересоздаёт уже открытые кэши.
+        self.close_caches()
+
+    def teardown_test_environment(self, **kwargs):
+        self.close_caches()
+        self.cache_override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+    @staticmethod
+    def close_caches():
+        for cache in caches.all():
+            cache.close()
+        caches._caches.caches = {}
@@ -20,6 +20,8 @@ from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
 
+from yatube import metrics
+
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
 
@@ -33,6 +35,7 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('admin/', admin.site.urls),
+    path('metrics', metrics.metrics, name='metrics'),
     path('', include('posts.urls')),
 ]
 
@@ -11,6 +11,9 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from yatube.staticfiles import wrap
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
-application = get_wsgi_application()
+# Статика и загрузки отдаются до Django, если включён SERVE_FILES.
+application = wrap(get_wsgi_application())